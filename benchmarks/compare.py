@@ -0,0 +1,59 @@
+"""
+Benchmark comparison
+
+Compares two result files of benchmarks.rest_api or benchmarks.startup
+endpoint by endpoint and flags the latencies and throughputs that got worse
+by more than a threshold.
+It exits with status 1 when there is a regression, so it can gate CI.
+
+Run it from the project root with:
+  python -m benchmarks.compare baseline.json results.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+# Metrics where a higher value is worse
+LATENCIES = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> list:
+    """Returns a row per endpoint and metric with the change in percent"""
+    rows = []
+    for endpoint, stats in results["endpoints"].items():
+        before = baseline["endpoints"].get(endpoint)
+        if before is None:
+            continue
+        for metric in LATENCIES + ("rps",):
+            if metric not in before or metric not in stats:
+                continue  # the startup benchmark has no throughput
+            old, new = before[metric], stats[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            worse = change > threshold if metric in LATENCIES else change < -threshold
+            rows.append((endpoint, metric, old, new, change, worse))
+    return rows
+
+
+def main():
+    """Prints the comparison and exits with 1 on a regression"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("baseline", help="results of the reference commit")
+    parser.add_argument("results", help="results of the commit under test")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed change in percent")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    with open(args.results, encoding="utf-8") as file:
+        results = json.load(file)
+
+    print(f"{baseline['commit'][:10]} -> {results['commit'][:10]}")
+    rows = compare(baseline, results, args.threshold)
+    for endpoint, metric, old, new, change, worse in rows:
+        flag = "  REGRESSION" if worse else ""
+        print(f"{endpoint:28} {metric:7} {old:10.3f} {new:10.3f} {change:+7.1f}%{flag}")
+    sys.exit(1 if any(row[-1] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
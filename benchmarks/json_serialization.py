@@ -0,0 +1,96 @@
+"""
+JSON serialization benchmark
+
+Compares the time to build the GET /products response body the old way,
+hydrating a Product per row and encoding the serialize() dictionaries with
+the standard library, with Product.rows() encoded by the orjson provider.
+
+Run it from the project root with:
+  python -m benchmarks.json_serialization --products 10000
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+# an in-memory database unless one is given, set before the app is imported
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+# pylint: disable=wrong-import-position
+from flask import jsonify  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from service import app  # noqa: E402
+from service.common.json_provider import OrjsonProvider  # noqa: E402
+from service.models import db, Product  # noqa: E402
+from tests.factories import ProductFactory  # noqa: E402
+
+
+def orm_objects():
+    """The response body built from Products"""
+    return jsonify([product.serialize() for product in Product.query.all()]).data
+
+
+def row_tuples():
+    """The response body built from Product.rows()"""
+    rows = Product.rows(Product.query).all()
+    return jsonify([Product.serialize_row(row) for row in rows]).data
+
+
+CASES = {
+    "orm+stdlib": (DefaultJSONProvider, orm_objects),
+    "orm+orjson": (OrjsonProvider, orm_objects),
+    "rows+stdlib": (DefaultJSONProvider, row_tuples),
+    "rows+orjson": (OrjsonProvider, row_tuples),
+}
+
+
+def seed(count: int):
+    """Replaces the products with count new ones"""
+    db.session.query(Product).delete()
+    db.session.commit()
+    Product.bulk_create(ProductFactory.build_batch(count))
+
+
+def measure(build, repeat: int) -> dict:
+    """Times build() repeat times and returns the summary in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        body = build()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "bytes": len(body),
+    }
+
+
+def main():
+    """Runs the benchmark and prints the results as JSON"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    seed(args.products)
+    results = {"products": args.products, "repeat": args.repeat, "cases": {}}
+    for name, (provider, build) in CASES.items():
+        app.json = provider(app)
+        results["cases"][name] = measure(build, args.repeat)
+    baseline = results["cases"]["orm+stdlib"]["median_ms"]
+    for case in results["cases"].values():
+        case["speedup"] = round(baseline / case["median_ms"], 2)
+
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(report + "\n")
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        main()
@@ -0,0 +1,244 @@
+"""
+REST API load benchmark
+
+Seeds the database with products made by tests.factories.ProductFactory and
+drives a mixed workload of reads, lists, writes and likes against the app,
+either in process through the Flask test client or over HTTP against a
+running server (for example a local gunicorn). The p50/p95/p99 latency and
+the requests per second of every endpoint are written as JSON, so the
+results of two commits can be compared with benchmarks.compare.
+
+Run it from the project root with:
+  python -m benchmarks.rest_api --products 10000 --requests 5000
+  python -m benchmarks.rest_api --url http://localhost:8080 --concurrency 8
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# an in-memory database unless one is given, set before the app is imported
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+# pylint: disable=wrong-import-position
+from service import app  # noqa: E402
+from service.models import db, Product  # noqa: E402
+from tests.factories import ProductFactory  # noqa: E402
+
+# Share of each operation in the default workload
+DEFAULT_MIX = "read=50,list=20,write=15,like=15"
+
+
+######################################################################
+# OPERATIONS
+######################################################################
+def read_product(client, ids, rng):
+    """GET /products/<id>"""
+    return "GET /products/<id>", client("GET", f"/products/{rng.choice(ids)}")
+
+
+def list_products(client, ids, rng):  # pylint: disable=unused-argument
+    """GET /products?category=...&limit=100"""
+    category = rng.choice(["ACCESSORIES", "BEAUTY", "FASHION", "GROCERIES"])
+    return "GET /products", client("GET", f"/products?category={category}&limit=100")
+
+
+def write_product(client, ids, rng):
+    """PUT /products/<id> with a new name"""
+    data = ProductFactory().serialize()
+    data["name"] = f"product {rng.randrange(1_000_000)}"
+    return "PUT /products/<id>", client("PUT", f"/products/{rng.choice(ids)}", data)
+
+
+def like_product(client, ids, rng):
+    """PUT /products/like/<id>"""
+    return "PUT /products/like/<id>", client("PUT", f"/products/like/{rng.choice(ids)}", {})
+
+
+OPERATIONS = {
+    "read": read_product,
+    "list": list_products,
+    "write": write_product,
+    "like": like_product,
+}
+
+
+######################################################################
+# CLIENTS
+######################################################################
+def local_client():
+    """Returns a client that calls the app in process"""
+    client = app.test_client()
+
+    def call(method, path, data=None):
+        return client.open(path, method=method, json=data).status_code
+
+    return call
+
+
+def http_client(url: str):
+    """Returns a client that calls a running server, one session per thread"""
+    import requests  # pylint: disable=import-outside-toplevel
+
+    local = threading.local()
+
+    def call(method, path, data=None):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session.request(method, url + path, json=data).status_code
+
+    return call
+
+
+######################################################################
+# BENCHMARK
+######################################################################
+def parse_mix(mix: str) -> dict:
+    """Parses a workload mix such as "read=80,like=20" into weights"""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}', choose from {', '.join(OPERATIONS)}")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def seed(count: int, url: str = None) -> list:
+    """Replaces the products with count new ones and returns their ids"""
+    products = ProductFactory.build_batch(count)
+    if url:
+        import requests  # pylint: disable=import-outside-toplevel
+
+        body = [product.serialize() for product in products]
+        response = requests.post(f"{url}/products:batch", json=body, timeout=600)
+        response.raise_for_status()
+        return [result["id"] for result in response.json()["results"] if "id" in result]
+    db.session.query(Product).delete()
+    db.session.commit()
+    Product.cache.clear()
+    return Product.bulk_create(products)
+
+
+def percentile(timings: list, percent: float) -> float:
+    """Returns a percentile of sorted timings with the nearest rank method"""
+    if not timings:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(timings)) - 1, 0)
+    return timings[min(rank, len(timings) - 1)]
+
+
+def summarize(samples: list, seconds: float) -> dict:
+    """Returns the latency percentiles and throughput of (endpoint, status, ms) samples"""
+    endpoints = {}
+    for endpoint, code, elapsed in samples:
+        stats = endpoints.setdefault(endpoint, {"timings": [], "errors": 0})
+        stats["timings"].append(elapsed)
+        stats["errors"] += code >= 400
+    results = {}
+    for endpoint, stats in sorted(endpoints.items()):
+        timings = sorted(stats["timings"])
+        results[endpoint] = {
+            "requests": len(timings),
+            "errors": stats["errors"],
+            "rps": round(len(timings) / seconds, 1) if seconds else 0.0,
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+        }
+    return results
+
+
+def run(client, ids: list, weights: dict, requests: int, concurrency: int, seed_value: int):
+    """Sends the requests and returns the samples and the elapsed seconds"""
+    operations = random.Random(seed_value).choices(
+        list(weights), weights=list(weights.values()), k=requests
+    )
+    samples = []
+    lock = threading.Lock()
+
+    def send(index, name):
+        rng = random.Random(seed_value + index)
+        start = time.perf_counter()
+        endpoint, code = OPERATIONS[name](client, ids, rng)
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            samples.append((endpoint, code, elapsed))
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        for index, name in enumerate(operations):
+            send(index, name)
+    else:
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(send, range(requests), operations))
+    return samples, time.perf_counter() - start
+
+
+def git_commit() -> str:
+    """Returns the commit being measured"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def benchmark(args) -> dict:
+    """Runs the benchmark described by the command line arguments"""
+    weights = parse_mix(args.mix)
+    ids = seed(args.products, args.url)
+    client = http_client(args.url) if args.url else local_client()
+    if args.warmup:
+        run(client, ids, weights, args.warmup, args.concurrency, args.seed + 1)
+    samples, seconds = run(client, ids, weights, args.requests, args.concurrency, args.seed)
+    return {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "target": args.url or "local",
+        "database": "server" if args.url else db.engine.dialect.name,
+        "products": args.products,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "mix": weights,
+        "seconds": round(seconds, 3),
+        "rps": round(len(samples) / seconds, 1),
+        "endpoints": summarize(samples, seconds),
+    }
+
+
+def main():
+    """Parses the command line, runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=10000, help="products to seed")
+    parser.add_argument("--requests", type=int, default=5000, help="requests to send")
+    parser.add_argument("--warmup", type=int, default=200, help="requests sent before measuring")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights")
+    parser.add_argument("--url", help="base URL of a running server instead of the test client")
+    parser.add_argument("--concurrency", type=int, default=1, help="client threads, with --url")
+    parser.add_argument("--seed", type=int, default=42, help="random seed of the workload")
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+    if args.concurrency > 1 and not args.url:
+        parser.error("--concurrency needs --url, the test client runs one request at a time")
+
+    results = benchmark(args)
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(report + "\n")
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        main()
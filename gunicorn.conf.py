@@ -0,0 +1,14 @@
+"""
+Gunicorn configuration
+
+SERVER_MODE=asgi serves service.asgi:app on uvicorn workers, so one
+worker can wait on many database queries at once. The default serves the
+Flask app on sync workers.
+"""
+import os
+
+if os.getenv("SERVER_MODE", "wsgi") == "asgi":
+    wsgi_app = "service.asgi:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "service:app"
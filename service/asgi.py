@@ -0,0 +1,482 @@
+"""
+ASGI Entry Point
+
+This module serves the product routes on an asyncio event loop with an
+async database driver (asyncpg on PostgreSQL, aiosqlite on SQLite), so a
+single worker can wait on many slow queries at once. It is selected with
+SERVER_MODE=asgi, see gunicorn.conf.py.
+
+The hot routes (health, list, read, create, update, delete, like and the
+change feed) are handled natively, each request in an app and request
+context of its own of the Flask app: its request hooks (metrics, request
+ids, memory sampling, read replica) and error handlers run around them, and they build their responses with the helpers
+of service.routes. A long poll of the change feed waits on the event loop,
+so it holds no worker or thread. Every other route, streamed lists and
+write-behind likes are passed on to the Flask app running in a thread
+pool, so both modes serve exactly the same API.
+"""
+import asyncio
+import io
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import Response, abort, g, jsonify, request, url_for
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.wrappers import Request
+
+from service import app as flask_app
+from service.common import status
+from service.common.replica import REPLICA_BIND
+from service.models import Product, ProductChange, SERIALIZED_FIELDS
+from service.routes import (
+    budget_query,
+    changed_ids,
+    changes_response,
+    check_content_type,
+    check_if_match,
+    get_fields,
+    get_number,
+    get_page_limit,
+    get_page_position,
+    leaderboard,
+    list_response,
+    page_response,
+    product_response,
+    refuse_over_budget,
+    wants_stream,
+    UPDATE_ATTEMPTS,
+)
+
+# Async drivers of the synchronous database URIs
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_database_uri(uri: str) -> str:
+    """Returns the async driver version of a database URI"""
+    url = make_url(uri)
+    url = url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+    return url.render_as_string(hide_password=False)
+
+
+def in_memory_sqlite(uri: str) -> bool:
+    """Checks if a database URI opens a new in-memory SQLite database"""
+    url = make_url(uri)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    """Runs a Flask app in a pool of threads
+
+    asgiref runs WSGI apps as thread sensitive code, all of them on one
+    thread per process, so one slow request would hold up every other one.
+    """
+
+    def __init__(self, wsgi_application, threads: int):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolWsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+class ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    """A request of ThreadPoolWsgiToAsgi"""
+
+    # the synchronous body of WsgiToAsgiInstance.run_wsgi_app()
+    run_wsgi_app_sync = vars(WsgiToAsgiInstance)["run_wsgi_app"].func
+
+    def __init__(self, wsgi_application, executor: ThreadPoolExecutor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    def run_wsgi_app_in_thread(self, body):
+        """Runs the request in an app context of its own
+
+        The thread copies the context of the event loop, which holds the app
+        context pushed by init_db(), and Flask would share its g with every
+        other request.
+        """
+        with self.wsgi_application.app_context():
+            self.run_wsgi_app_sync(body)
+
+    async def run_wsgi_app(self, body):
+        run = sync_to_async(self.run_wsgi_app_in_thread, thread_sensitive=False, executor=self.executor)
+        await run(body)
+
+
+class AsyncProductService:
+    """The ASGI application"""
+
+    def __init__(self, flask):
+        self.flask = flask
+        # one thread per database connection the Flask app can open
+        threads = flask.config["DB_POOL_SIZE"] + max(flask.config["DB_MAX_OVERFLOW"], 0)
+        self.fallback = ThreadPoolWsgiToAsgi(flask, threads)
+        self.session_factories = {}
+        self.routes = [
+            ("GET", re.compile(r"^/health$"), self.health),
+            ("GET", re.compile(r"^/products$"), self.list_products),
+            ("GET", re.compile(r"^/products/changes$"), self.get_changes),
+            ("POST", re.compile(r"^/products$"), self.create_products),
+            ("GET", re.compile(r"^/products/(\d+)$"), self.get_products),
+            ("PUT", re.compile(r"^/products/(\d+)$"), self.update_products),
+            ("DELETE", re.compile(r"^/products/(\d+)$"), self.delete_products),
+            ("PUT", re.compile(r"^/products/like/(\d+)$"), self.like_products),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.fallback(scope, receive, send)
+            return
+        handler, args = self.match(scope)
+        if handler is None:
+            await self.fallback(scope, receive, send)
+            return
+        environ = build_environ(scope, await read_body(receive))
+        response = await self.dispatch(environ, handler, args)
+        await send_response(send, response, environ)
+
+    def match(self, scope: dict):
+        """Returns the native handler of a request and its arguments
+
+        The requests left to the Flask app are chosen here, before any
+        request hook has run.
+        """
+        for method, pattern, handler in self.routes:
+            if scope["method"] == method:
+                found = pattern.match(scope["path"])
+                if found and self.handles(handler, scope):
+                    return handler, [int(arg) for arg in found.groups()]
+        return None, []
+
+    def handles(self, handler, scope: dict) -> bool:
+        """Checks if a native handler serves a request, not a stream or a write-behind like"""
+        if handler == self.like_products:
+            return not self.flask.config["LIKE_WRITE_BEHIND"]
+        if handler == self.list_products:
+            return not wants_stream(Request(build_environ(scope, b"")))
+        return True
+
+    async def dispatch(self, environ: dict, handler, args: list):
+        """Runs a native handler the way Flask's full_dispatch_request() does
+
+        The request hooks and error handlers of the Flask app run around the
+        handler, and its teardown hooks run once the response is built. Each
+        request pushes its own app context: the tasks of the event loop all
+        inherit the one pushed by init_db(), and would share its g.
+        """
+        with self.flask.app_context(), self.flask.request_context(environ):
+            try:
+                try:
+                    response = self.flask.preprocess_request()
+                    if response is None:
+                        response = await handler(*args)
+                except Exception as error:  # pylint: disable=broad-except
+                    response = self.flask.handle_user_exception(error)
+                return self.flask.finalize_request(response)
+            except Exception as error:  # pylint: disable=broad-except
+                return self.flask.handle_exception(error)
+
+    def session(self, replica: bool = False):
+        """Returns a new AsyncSession, creating the engine on first use
+
+        A replica session reads from REPLICA_DATABASE_URI, pass it
+        g.read_replica as chosen by service.common.replica. In-memory SQLite
+        is refused, every connection to it opens another empty database.
+        """
+        config = self.flask.config
+        key = REPLICA_BIND if replica else None
+        if key not in self.session_factories:
+            if key == REPLICA_BIND:
+                uri = async_database_uri(config["REPLICA_DATABASE_URI"])
+            else:
+                uri = config["ASYNC_DATABASE_URI"] or async_database_uri(config["SQLALCHEMY_DATABASE_URI"])
+            if in_memory_sqlite(uri):
+                raise ValueError(
+                    f"The async driver cannot share the in-memory SQLite database {uri}, "
+                    "use a file database such as sqlite:////tmp/products.db"
+                )
+            engine = create_async_engine(uri, **async_engine_options(config))
+            self.session_factories[key] = async_sessionmaker(engine, expire_on_commit=False)
+        return self.session_factories[key]()
+
+    async def read(self, statement) -> list:
+        """Returns the rows of a select() statement, from the replica when chosen"""
+        async with self.session(g.read_replica) as session:
+            return (await session.execute(statement)).all()
+
+    ######################################################################
+    # ROUTES
+    ######################################################################
+
+    async def health(self):
+        """Health check for Kubernetes"""
+        return jsonify(status="OK"), status.HTTP_200_OK
+
+    async def list_products(self):
+        """Lists the products matching the filters, see routes.list_products()"""
+        self.flask.logger.info("Request for product list")
+        fields = get_fields() or SERIALIZED_FIELDS
+        sort = Product.parse_sort(request.args.get("sort", ""))
+        names = tuple(name for name, _ in sort)
+        statement = select(*Product.row_columns(fields, names)).where(
+            *Product.filter_criteria(request.args)
+        )
+
+        if "limit" in request.args or "cursor" in request.args:
+            limit = get_page_limit()
+            statement = Product.page_query(statement, limit, get_page_position(sort), sort)
+            return page_response(await self.read(statement), limit, fields, sort)
+
+        response, reason = list_response(await self.read(budget_query(statement, sort)), fields)
+        if reason:
+            # see routes.over_budget()
+            refuse_over_budget(reason)
+            self.flask.logger.warning("Product list has %s, streaming it", reason)
+            return self.stream_array(statement, fields, sort)
+        return response
+
+    def stream_array(self, statement, fields: tuple, sort: tuple):
+        """Streams the rows of a select() as a JSON array, see routes.list_products_array()"""
+        statement = statement.order_by(*Product.sort_clauses(sort)).execution_options(
+            yield_per=self.flask.config["STREAM_BATCH_SIZE"]
+        )
+        replica = g.read_replica
+        dumps = self.flask.json.dumps
+
+        async def generate():
+            separator = "["
+            async with self.session(replica) as session:
+                async for row in await session.stream(statement):
+                    yield separator + dumps(Product.serialize_row(row, fields))
+                    separator = ","
+            yield "[]" if separator == "[" else "]"
+
+        return StreamedResponse(generate(), mimetype="application/json")
+
+    async def get_products(self, product_id):
+        """Returns a single product through the cache, see Product.find_cached()"""
+        self.flask.logger.info("Request for product with id: %s", product_id)
+        fields = get_fields()
+        entry = Product.cache.get(product_id)
+        if entry is not None:
+            found = Product.project(entry, fields)
+        elif fields is not None:
+            # read only the requested columns, the cache keeps whole Products
+            statement = select(*Product.row_columns(fields, ("updated_at",))).where(
+                Product.id == product_id
+            )
+            found = (None, None, None)
+            for row in await self.read(statement):
+                found = (f"{row.id}-{row.version}", Product.serialize_row(row, fields), row.updated_at)
+        else:
+            found = await self.find_cached(product_id)
+        return product_response(product_id, fields, *found)
+
+    async def find_cached(self, product_id: int) -> tuple:
+        """Reads a whole Product into the cache, see Product.find_cached()"""
+        async with self.session(g.read_replica) as session:
+            product = await session.get(Product, product_id)
+        if product is None:
+            return None, None, None
+        entry = (product.etag, product.serialize())
+        if not g.read_replica:
+            # a lagging replica must not put an old version in the cache
+            Product.cache.set(product_id, entry)
+        return Product.project(entry)
+
+    async def create_products(self):
+        """Creates a product"""
+        self.flask.logger.info("Request to Create a Product...")
+        check_content_type("application/json")
+        product = Product().deserialize(request.get_json())
+        product.id = None
+        async with self.session() as session:
+            session.add(product)
+            await session.commit()
+        Product.cache.delete(product.id)
+        Product.name_index.add(product.id, product.name)
+        message = product.serialize()
+        leaderboard.record(message)
+        location = url_for("get_products", product_id=product.id, _external=True)
+        return jsonify(message), status.HTTP_201_CREATED, {"Location": location}
+
+    async def update_products(self, product_id):
+        """Updates a product, see routes.update_products()"""
+        self.flask.logger.info("Request to update product with id: %s", product_id)
+        check_content_type("application/json")
+        data = request.get_json()
+        for _ in range(UPDATE_ATTEMPTS):
+            async with self.session() as session:
+                product = await session.get(Product, product_id)
+                if product is None:
+                    abort(status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found.")
+                check_if_match(product_id, product.etag)
+                product.deserialize(data)
+                product.id = product_id
+                try:
+                    await session.commit()
+                    break
+                except StaleDataError:
+                    check_if_match(product_id, None)
+        else:
+            abort(status.HTTP_409_CONFLICT, f"Product with id '{product_id}' is being modified, try again.")
+        Product.cache.delete(product_id)
+        Product.name_index.add(product_id, product.name)
+        message = product.serialize()
+        leaderboard.record(message)
+        return jsonify(message), status.HTTP_200_OK, {"ETag": f'"{product.etag}"'}
+
+    async def delete_products(self, product_id):
+        """Deletes a product by id whatever its version"""
+        self.flask.logger.info("Request to delete product with id: %s", product_id)
+        async with self.session() as session:
+            row = (await session.execute(Product.delete_statement(product_id))).first()
+            if row:
+                await session.execute(
+                    insert(ProductChange.__table__),
+                    ProductChange.values([(product_id, "delete", row.version)]),
+                )
+            await session.commit()
+        Product.cache.delete(product_id)
+        Product.name_index.discard(product_id)
+        leaderboard.discard(product_id)
+        return jsonify(message="success"), status.HTTP_204_NO_CONTENT
+
+    async def like_products(self, product_id):
+        """Atomically adds a like to a product"""
+        self.flask.logger.info("Request to like product with id: %s", product_id)
+        check_content_type("application/json")
+        table = Product.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == product_id)
+            .values(like=table.c.like + 1, version=table.c.version + 1)
+            .returning(*table.c)
+        )
+        async with self.session() as session:
+            row = (await session.execute(statement)).first()
+            if row:
+                await session.execute(
+                    insert(ProductChange.__table__),
+                    ProductChange.values([(row.id, "like", row.version)]),
+                )
+            await session.commit()
+        if row is None:
+            abort(status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found.")
+        Product.cache.delete(product_id)
+        message = Product(**row._mapping).serialize()
+        leaderboard.record(message)
+        return jsonify(message), status.HTTP_200_OK
+
+    async def get_changes(self):
+        """Returns the changes after a sequence number, see routes.get_changes()"""
+        self.flask.logger.info("Request for product changes")
+        config = self.flask.config
+        if "since" not in request.args:
+            async with self.session(g.read_replica) as session:
+                last = await session.scalar(select(func.max(ProductChange.seq)))
+            return jsonify(changes=[], next=last or 0), status.HTTP_200_OK
+        since = get_number("since", int, 0)
+        wait = get_number("wait", float, 0, config["MAX_CHANGES_WAIT"])
+        limit = get_page_limit(config["CHANGES_LIMIT"], config["CHANGES_LIMIT"])
+
+        deadline = time.monotonic() + wait
+        changes = await self.find_changes(since, limit)
+        while not changes and time.monotonic() < deadline:
+            await asyncio.sleep(min(config["CHANGES_POLL_INTERVAL"], max(deadline - time.monotonic(), 0)))
+            changes = await self.find_changes(since, limit)
+
+        ids = changed_ids(changes)
+        rows = await self.read(select(*Product.row_columns()).where(Product.id.in_(ids))) if ids else []
+        return changes_response(changes, rows, since)
+
+    async def find_changes(self, since: int, limit: int) -> list:
+        """Reads the changes of ProductChange.find_since() in a new session"""
+        first_statement, statement = ProductChange.since_statements(since, limit)
+        # each check runs in its own transaction to see the new commits
+        async with self.session(g.read_replica) as session:
+            first = await session.scalar(first_statement)
+            changes = (await session.scalars(statement)).all()
+        return ProductChange.settled(changes, since, first, self.flask.config["CHANGES_SETTLE_SECONDS"])
+
+
+class StreamedResponse(Response):  # pylint: disable=too-many-ancestors
+    """A response whose body is sent from an async iterator of text chunks"""
+
+    def __init__(self, chunks, **kwargs):
+        # an empty iterator, so werkzeug sets no Content-Length
+        super().__init__(iter(()), **kwargs)
+        self.chunks = chunks
+
+
+def async_engine_options(config: dict) -> dict:
+    """Returns the pool options of the async engine"""
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    if url.get_backend_name() != "postgresql":
+        return {}
+    options = {
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+    }
+    if config["DB_STATEMENT_TIMEOUT"]:
+        options["connect_args"] = {
+            "server_settings": {"statement_timeout": str(config["DB_STATEMENT_TIMEOUT"])}
+        }
+    return options
+
+
+def build_environ(scope: dict, body: bytes) -> dict:
+    """Returns the WSGI environ of a request, as the Flask fallback sees it"""
+    instance = WsgiToAsgiInstance(None)
+    instance.scope = scope
+    environ = instance.build_environ(scope, io.BytesIO(body))
+    # the whole body has been read, also when it was sent in chunks
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
+
+async def send_response(send, response, environ: dict):
+    """Sends a Flask response"""
+    app_iter, _, headers = response.get_wsgi_response(environ)
+    try:
+        body = b"".join(app_iter)
+    finally:
+        response.close()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ],
+        }
+    )
+    if isinstance(response, StreamedResponse):
+        async for chunk in response.chunks:
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_body(receive) -> bytes:
+    """Reads the whole request body"""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+app = AsyncProductService(flask_app)
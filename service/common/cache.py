@@ -0,0 +1,145 @@
+"""
+Cache
+
+This module contains the cache backends used to keep serialized products
+in front of the database. The in-process LRUCache is the default, other
+backends such as a shared Redis cache only need to implement CacheBackend
+and can be selected with the CACHE_BACKEND setting as "module:ClassName"
+"""
+import importlib
+import threading
+from abc import ABC, abstractmethod
+import time
+from collections import OrderedDict
+
+
+class CacheBackend(ABC):
+    """Interface of the cache backends
+
+    Subclasses implement _get(), set(), delete() and clear(), a backend
+    missing one of them cannot be created; the hit and miss counters are
+    kept by get().
+    """
+
+    name = "base"
+
+    def __init__(self, config: dict):  # pylint: disable=unused-argument
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the cached value of a key or None"""
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    @abstractmethod
+    def _get(self, key):
+        """Returns the cached value of a key or None without counting"""
+
+    @abstractmethod
+    def set(self, key, value):
+        """Caches a value"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Removes a key from the cache"""
+
+    @abstractmethod
+    def clear(self):
+        """Removes every key from the cache"""
+
+    def __len__(self):
+        return 0
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+        }
+
+
+class NullCache(CacheBackend):
+    """A cache that never holds anything"""
+
+    name = "none"
+
+    def _get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(CacheBackend):
+    """An in-process cache with least recently used eviction and a TTL
+
+    Every worker process has its own copy, so a write handled by another
+    worker is only seen here once the entry expires after CACHE_TTL seconds.
+    """
+
+    name = "memory"
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.maxsize = config.get("CACHE_SIZE", 1024)
+        self.ttl = config.get("CACHE_TTL", 5.0)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+BACKENDS = {"none": NullCache, "memory": LRUCache}
+
+
+def create_cache(config: dict) -> CacheBackend:
+    """Creates the cache backend named by the CACHE_BACKEND setting"""
+    name = config.get("CACHE_BACKEND", "memory")
+    if name in BACKENDS:
+        return BACKENDS[name](config)
+    module_name, _, class_name = name.partition(":")
+    backend = getattr(importlib.import_module(module_name), class_name)
+    return backend(config)
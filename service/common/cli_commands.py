@@ -1,8 +1,15 @@
 """
 Flask CLI Command Extensions
 """
+from datetime import datetime, timedelta, timezone
+import click
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
 from service import app
-from service.models import db
+from service.models import db, Product, ProductChange
+
+# Key of the PostgreSQL advisory lock taken by "flask db-init"
+DB_INIT_LOCK = 7_411_902
 
 
 ######################################################################
@@ -19,3 +26,118 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to create the missing tables before the workers start
+# Usage:
+#   flask db-init
+######################################################################
+@app.cli.command("db-init")
+def db_init():
+    """
+    Creates the tables and indexes that do not exist yet, keeping any
+    existing data. Run it once per deployment when DB_AUTO_CREATE is off.
+    On PostgreSQL concurrent runs wait for each other on an advisory lock,
+    as two CREATE TABLE of the same table fail even when they check first.
+    """
+    with db.engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # held until the tables are committed
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": DB_INIT_LOCK})
+        db.metadata.create_all(conn)
+    app.logger.info("Database tables are ready")
+
+
+######################################################################
+# Command to upgrade an existing database in place
+# Usage:
+#   flask db-upgrade
+######################################################################
+@app.cli.command("db-upgrade")
+def db_upgrade():
+    """
+    Adds the missing columns, tables and indexes of an existing database
+    without dropping any data. On PostgreSQL the indexes are built CONCURRENTLY so
+    the product table stays writable while they are built.
+    """
+    engine = db.engine
+    postgres = engine.dialect.name == "postgresql"
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        add_missing_columns(conn)
+        ProductChange.__table__.create(conn, checkfirst=True)
+        if postgres:
+            # the trigram index of the name needs the pg_trgm extension
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            drop_invalid_indexes(conn)
+        for index in Product.__table__.indexes:
+            if not created_on(index, engine.dialect.name):
+                continue
+            ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+            if postgres:
+                ddl = ddl.replace("CREATE INDEX ", "CREATE INDEX CONCURRENTLY ", 1)
+            conn.execute(text(ddl))
+            app.logger.info("Index %s is ready", index.name)
+
+
+######################################################################
+# Command to delete the old changes of the change feed
+# Usage:
+#   flask changes-prune [--days 7]
+######################################################################
+@app.cli.command("changes-prune")
+@click.option("--days", type=int, default=None, help="Keep the changes of the last days")
+def changes_prune(days):
+    """
+    Deletes the changes of GET /products/changes older than
+    CHANGES_RETENTION_DAYS. Consumers that are further behind get 410 Gone
+    and read the products again.
+    """
+    days = app.config["CHANGES_RETENTION_DAYS"] if days is None else days
+    before = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+    count = ProductChange.prune(before)
+    app.logger.info("Deleted %d changes older than %d days", count, days)
+
+
+def created_on(index, dialect_name: str) -> bool:
+    """Checks if an index is created on a database, see Index.ddl_if()"""
+    condition = index._ddl_if  # pylint: disable=protected-access
+    return condition is None or condition.dialect in (None, dialect_name)
+
+
+def drop_invalid_indexes(conn):
+    """Drops the indexes left invalid by an interrupted concurrent build"""
+    names = [index.name for index in Product.__table__.indexes]
+    invalid = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE NOT i.indisvalid"
+        )
+    ).scalars()
+    for name in invalid:
+        if name in names:
+            app.logger.warning("Dropping invalid index %s", name)
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+
+
+def add_missing_columns(conn):
+    """Adds the Product columns that the existing table does not have yet"""
+    table = Product.__table__
+    dialect = conn.dialect
+    quote = dialect.identifier_preparer.quote
+    existing = {column["name"] for column in db.inspect(conn).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = f"{quote(column.name)} {column.type.compile(dialect=dialect)}"
+        if column.server_default is not None:
+            default = column.server_default.arg
+            if isinstance(default, str):
+                default = "'" + default.replace("'", "''") + "'"
+            ddl += f" DEFAULT {getattr(default, 'text', default)}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+        conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {ddl}"))
+        app.logger.info("Column %s added", column.name)
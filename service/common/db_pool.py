@@ -0,0 +1,125 @@
+"""
+Database Pool
+
+This module builds the SQLAlchemy engine options of the connection pool
+from the configuration, sets up SQLite connections and reports how the
+pool is being used
+"""
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool that records the checkouts that wait for a connection
+
+    A checkout waits when every connection, overflow included, is in use
+    as it starts. connect() notes when it starts and the checkout event
+    records the wait once it got its connection.
+    """
+
+    def __init__(self, creator, pool_size: int = 5, max_overflow: int = 10, **kwargs):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs)
+        # a negative max_overflow opens as many connections as asked for
+        self.max_connections = pool_size + max_overflow if max_overflow >= 0 else None
+        self.checkout_count = 0
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+        self.wait_max = 0.0
+        self._wait_lock = threading.Lock()
+        self._checkout = threading.local()
+        event.listen(self, "checkout", self.record_checkout)
+
+    def connect(self):
+        """Checks out a connection, noting if it has to wait for one"""
+        self._checkout.start = time.perf_counter()
+        self._checkout.waits = (
+            self.max_connections is not None and self.checkedout() >= self.max_connections
+        )
+        return super().connect()
+
+    def record_checkout(self, dbapi_connection, connection_record, connection_proxy):  # pylint: disable=unused-argument
+        """Counts a checkout and the time it waited, see connect()"""
+        start = self._checkout.__dict__.pop("start", None)
+        if start is None:
+            return
+        waited = time.perf_counter() - start
+        with self._wait_lock:
+            self.checkout_count += 1
+            if self._checkout.waits:
+                self.wait_count += 1
+                self.wait_seconds += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+def engine_options(config: dict) -> dict:
+    """Returns the SQLAlchemy engine options for the configured database
+
+    Pool sizing only applies to server databases, SQLite keeps the pool
+    chosen by Flask-SQLAlchemy.
+    """
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    if url.get_backend_name() == "sqlite":
+        return {}
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+    }
+    if url.get_backend_name() == "postgresql" and config["DB_STATEMENT_TIMEOUT"]:
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"
+        }
+    return options
+
+
+# Journal modes accepted by PRAGMA journal_mode
+SQLITE_JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+
+
+def configure_sqlite(engine, config: dict):
+    """Sets the pragmas of every new connection of a SQLite engine
+
+    File databases use SQLITE_JOURNAL_MODE, WAL by default, so readers do
+    not block the writer. In-memory databases ignore the journal mode.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    journal_mode = config.get("SQLITE_JOURNAL_MODE", "WAL").upper()
+    if journal_mode not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f"Invalid SQLITE_JOURNAL_MODE '{journal_mode}'")
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):  # pylint: disable=unused-argument
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        if journal_mode == "WAL":
+            # safe with WAL, the last commits may only be lost on power loss
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
+def pool_stats(pool) -> dict:
+    """Returns the usage counters of a connection pool"""
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    if isinstance(pool, TimedQueuePool):
+        stats.update(
+            checkouts=pool.checkout_count,
+            waits=pool.wait_count,
+            wait_seconds=pool.wait_seconds,
+            wait_max_seconds=pool.wait_max,
+        )
+    return stats
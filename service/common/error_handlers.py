@@ -18,7 +18,7 @@
 Module: error_handlers
 """
 from flask import jsonify
-from service.models import DataValidationError
+from service.models import ChangesPruned, DataValidationError
 from service import app
 from . import status
 
@@ -86,6 +86,51 @@ def resource_conflict(error):
     )
 
 
+@app.errorhandler(status.HTTP_412_PRECONDITION_FAILED)
+def precondition_failed(error):
+    """Handles failed conditional requests with HTTP_412_PRECONDITION_FAILED"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_412_PRECONDITION_FAILED,
+            error="Precondition Failed",
+            message=message,
+        ),
+        status.HTTP_412_PRECONDITION_FAILED,
+    )
+
+
+@app.errorhandler(ChangesPruned)
+def changes_pruned(error):
+    """Handles change feed positions that are no longer kept with HTTP_410_GONE"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_410_GONE,
+            error="Gone",
+            message=message,
+        ),
+        status.HTTP_410_GONE,
+    )
+
+
+@app.errorhandler(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+def request_entity_too_large(error):
+    """Handles oversized requests with HTTP_413_REQUEST_ENTITY_TOO_LARGE"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            error="Request Entity Too Large",
+            message=message,
+        ),
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    )
+
+
 @app.errorhandler(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
 def mediatype_not_supported(error):
     """Handles unsupported media requests with 415_UNSUPPORTED_MEDIA_TYPE"""
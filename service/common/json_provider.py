@@ -0,0 +1,62 @@
+"""
+JSON Provider
+
+This module contains the JSON providers of the Flask app. The orjson
+provider is used when orjson is installed, it encodes straight to bytes
+several times faster than the standard library. Another provider can be
+selected with the JSON_PROVIDER setting as "default", "orjson" or
+"module:ClassName"
+"""
+import importlib
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that encodes and decodes with orjson
+
+    Types orjson does not know are handed to DefaultJSONProvider.default,
+    and calls with extra json.dumps arguments fall back to the standard
+    library. Unlike the default provider, dates are written in ISO 8601.
+    """
+
+    def dumps_bytes(self, obj) -> bytes:
+        """Serializes obj to UTF-8 encoded JSON"""
+        option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
+PROVIDERS = {
+    "default": DefaultJSONProvider,
+    "orjson": OrjsonProvider,
+}
+
+
+def create_provider(app):
+    """Creates the JSON provider named by the JSON_PROVIDER setting"""
+    name = app.config.get("JSON_PROVIDER", "auto")
+    if name == "auto":
+        name = "default" if orjson is None else "orjson"
+    if name in PROVIDERS:
+        return PROVIDERS[name](app)
+    module_name, _, class_name = name.partition(":")
+    provider = getattr(importlib.import_module(module_name), class_name)
+    return provider(app)
@@ -0,0 +1,88 @@
+"""
+Leaderboard
+
+This module keeps the most liked products of every category in memory so
+the storefront widgets are served without sorting the catalog. Each board
+is loaded from the database on first use, updated in place as products are
+liked, and reloaded after LEADERBOARD_TTL seconds to pick up the likes
+received by other workers
+"""
+import threading
+import time
+
+
+def _rank(product: dict) -> tuple:
+    """Sort key of a board, most likes first and the newest id on ties"""
+    return -product["like"], -product["id"]
+
+
+class Leaderboard:
+    """The top products by likes of every category
+
+    A board holds the ``size`` most liked products of a category. When a
+    product drops out of a board the next one is unknown, so the board is
+    dropped and loaded again on the next read.
+    """
+
+    def __init__(self, load_top, size: int = 10, ttl: float = 60.0):
+        """
+        Args:
+            load_top (callable): returns the serialized top products of a
+                category, given the category name and the number of products
+            size (int): the number of products kept per category
+            ttl (float): seconds before a board is loaded again
+        """
+        self.load_top = load_top
+        self.size = size
+        self.ttl = ttl
+        self._boards = {}
+        self._lock = threading.Lock()
+
+    def top(self, category: str, count: int) -> list:
+        """Returns the ``count`` most liked products of a category"""
+        now = time.monotonic()
+        with self._lock:
+            loaded_at, board = self._boards.get(category, (None, None))
+        if board is None or now - loaded_at > self.ttl:
+            board = sorted(self.load_top(category, self.size), key=_rank)
+            with self._lock:
+                self._boards[category] = (now, board)
+        return [dict(product) for product in board[:count]]
+
+    def record(self, product: dict):
+        """Updates the boards with a product that was created, updated or liked"""
+        with self._lock:
+            self._remove(product["id"], product)
+            loaded_at, board = self._boards.get(product["category"], (None, None))
+            if board is None:
+                return
+            board = sorted(board + [dict(product)], key=_rank)[:self.size]
+            self._boards[product["category"]] = (loaded_at, board)
+
+    def discard(self, product_id: int):
+        """Removes a deleted product from the boards"""
+        with self._lock:
+            self._remove(product_id)
+
+    def clear(self):
+        """Drops every board, they are loaded again on the next read"""
+        with self._lock:
+            self._boards.clear()
+
+    def _remove(self, product_id: int, product: dict = None):
+        """Takes a product out of its board, dropping boards that lose a rank"""
+        for category, (loaded_at, board) in list(self._boards.items()):
+            for old in board:
+                if old["id"] != product_id:
+                    continue
+                if (
+                    product is None
+                    or product["category"] != category
+                    or product["like"] < old["like"]
+                ):
+                    # a product outside of the board may now rank higher
+                    del self._boards[category]
+                else:
+                    board = [entry for entry in board if entry is not old]
+                    self._boards[category] = (loaded_at, board)
+                return
@@ -0,0 +1,93 @@
+"""
+Like Buffer
+
+This module buffers likes in memory and writes them to the database as
+aggregated deltas, so a burst of likes on one product costs one UPDATE
+per flush interval instead of one UPDATE per request
+"""
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger("flask.app")
+
+
+class LikeBuffer:
+    """Aggregates likes per product and flushes them on an interval
+
+    Each worker process keeps its own buffer, so likes that have not been
+    flushed yet are only visible to the worker that received them.
+    """
+
+    def __init__(self, app, flush_likes, interval: float = 1.0):
+        """
+        Args:
+            app (Flask): the app whose context is used to flush
+            flush_likes (callable): writes a dict of product id -> likes
+            interval (float): seconds between two flushes
+        """
+        self.app = app
+        self.flush_likes = flush_likes
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, product_id: int, likes: int = 1) -> int:
+        """Buffers likes for a product and returns its pending likes"""
+        self._start()
+        with self._lock:
+            self._pending[product_id] = self._pending.get(product_id, 0) + likes
+            return self._pending[product_id]
+
+    def pending(self, product_id: int) -> int:
+        """Returns the likes of a product that have not been flushed yet"""
+        with self._lock:
+            return self._pending.get(product_id, 0)
+
+    def flush(self) -> int:
+        """Writes the buffered likes and returns the number of products updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            with self.app.app_context():
+                self.flush_likes(pending)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Could not flush likes, will retry")
+            with self._lock:
+                for product_id, likes in pending.items():
+                    self._pending[product_id] = self._pending.get(product_id, 0) + likes
+            return 0
+        logger.info("Flushed likes of %d products", len(pending))
+        return len(pending)
+
+    def stop(self):
+        """Stops the background flush and writes what is left"""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _start(self):
+        """Starts the flush thread the first time it is needed"""
+        if self._thread:
+            return
+        with self._lock:
+            if self._thread:
+                return
+            # started lazily so the thread is created after gunicorn forks
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="like-buffer", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        """Flushes the buffer every interval until stopped"""
+        while not self._stopped.wait(self.interval):
+            self.flush()
@@ -21,6 +21,22 @@ This module contains utility functions to set up logging
 consistently
 """
 import logging
+import re
+import uuid
+from flask import g, has_request_context, request
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the id of the current request to the log records"""
+
+    def filter(self, record):
+        record.request_id = "-"
+        if has_request_context():
+            record.request_id = g.get("request_id", "-")
+        return True
 
 
 def init_logging(app, logger_name: str):
@@ -31,8 +47,28 @@ def init_logging(app, logger_name: str):
     app.logger.setLevel(gunicorn_logger.level)
     # Make all log formats consistent
     formatter = logging.Formatter(
-        "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z"
+        "[%(asctime)s] [%(levelname)s] [%(request_id)s] [%(module)s] %(message)s",
+        "%Y-%m-%d %H:%M:%S %z",
     )
     for handler in app.logger.handlers:
         handler.setFormatter(formatter)
+        handler.addFilter(RequestIdFilter())
+    init_request_id(app)
     app.logger.info("Logging handler established")
+
+
+def init_request_id(app):
+    """Gives every request an id that is logged and returned to the client"""
+
+    @app.before_request
+    def assign_request_id():
+        request_id = request.headers.get(REQUEST_ID_HEADER, "")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        g.request_id = request_id
+
+    @app.after_request
+    def add_request_id_header(response):
+        if "request_id" in g:
+            response.headers[REQUEST_ID_HEADER] = g.request_id
+        return response
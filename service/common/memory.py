@@ -0,0 +1,55 @@
+"""
+Memory
+
+This module traces the allocations of a sample of the requests with
+tracemalloc (MEMORY_SAMPLE_RATE of them) and records their peak in the
+http_request_peak_memory_bytes histogram of GET /metrics. The peak of a
+streamed response is taken once the whole body has been sent. Tracing
+slows a request down, so one request is traced at a time and tracemalloc
+sees every thread, so with threaded workers the peak also holds the
+allocations of the requests running next to it
+"""
+import random
+import resource
+import threading
+import tracemalloc
+from flask import g, request
+from service import app
+from service.common import metrics
+
+_tracing = threading.Lock()
+
+
+def max_resident_bytes() -> int:
+    """Returns the peak resident memory of the process"""
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+######################################################################
+# Request hooks
+######################################################################
+@app.before_request
+def start_tracing():
+    """Starts tracing the allocations of a sampled request"""
+    rate = app.config["MEMORY_SAMPLE_RATE"]
+    if rate <= 0 or random.random() >= rate:
+        return
+    # someone else may be using tracemalloc, such as python -X tracemalloc
+    if tracemalloc.is_tracing() or not _tracing.acquire(blocking=False):
+        return
+    tracemalloc.start()
+    g.memory_traced = True
+
+
+@app.teardown_request
+def record_peak_memory(error=None):  # pylint: disable=unused-argument
+    """Records the peak memory of a traced request"""
+    if not g.pop("memory_traced", False):
+        return
+    try:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        metrics.REQUEST_PEAK_MEMORY.observe((request.endpoint or "unknown",), peak)
+    finally:
+        _tracing.release()
@@ -0,0 +1,189 @@
+"""
+Metrics
+
+This module records the request count, status codes and latency of every
+route together with the number and duration of the SQL statements each
+request runs, and renders them in the Prometheus text exposition format
+"""
+import threading
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from service import app
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+MEMORY_BUCKETS = (65536, 262144, 1048576, 4194304, 16777216, 33554432, 67108864)
+
+
+def escape(value) -> str:
+    """Escapes a label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple, values: tuple) -> str:
+    """Formats label values as {name="value",...}"""
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """A monotonically increasing count per set of label values"""
+
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        """Adds to the count of the label values"""
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        """Returns the exposition lines of the counter"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """A distribution of observations in cumulative buckets per set of label values"""
+
+    def __init__(self, name: str, description: str, labels: tuple, buckets: tuple):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        """Records one observation for the label values"""
+        with self._lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        """Returns the exposition lines of the histogram"""
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        names = self.labels + ("le",)
+        with self._lock:
+            for labels, series in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, series):
+                    bucket_labels = format_labels(names, labels + (bound,))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                bucket_labels = format_labels(names, labels + ("+Inf",))
+                lines.append(f"{self.name}_bucket{bucket_labels} {series[-1]}")
+                label_text = format_labels(self.labels, labels)
+                lines.append(f"{self.name}_sum{label_text} {series[-2]}")
+                lines.append(f"{self.name}_count{label_text} {series[-1]}")
+        return lines
+
+
+def gauge(name: str, description: str, value: float) -> list:
+    """Returns the exposition lines of a gauge read at scrape time"""
+    return [f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+def counter(name: str, description: str, value: float) -> list:
+    """Returns the exposition lines of a total kept elsewhere, read at scrape time"""
+    return [f"# HELP {name} {description}", f"# TYPE {name} counter", f"{name} {value}"]
+
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and status", ("endpoint", "method", "status")
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests",
+    ("endpoint", "method"),
+    LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "db_queries_per_request",
+    "SQL statements run by each HTTP request",
+    ("endpoint",),
+    QUERY_COUNT_BUCKETS,
+)
+DB_QUERY_TIME = Histogram(
+    "db_query_duration_seconds_per_request",
+    "Time each HTTP request spent running SQL statements",
+    ("endpoint",),
+    LATENCY_BUCKETS,
+)
+REQUEST_PEAK_MEMORY = Histogram(
+    "http_request_peak_memory_bytes",
+    "Peak memory allocated by the HTTP requests sampled with tracemalloc",
+    ("endpoint",),
+    MEMORY_BUCKETS,
+)
+METRICS = (REQUESTS, REQUEST_LATENCY, DB_QUERIES, DB_QUERY_TIME, REQUEST_PEAK_MEMORY)
+
+
+def render(*gauges: list) -> str:
+    """Returns every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for lines_of_gauge in gauges:
+        lines.extend(lines_of_gauge)
+    return "\n".join(lines) + "\n"
+
+
+######################################################################
+# Request hooks
+######################################################################
+@app.before_request
+def start_request_timer():
+    """Starts measuring the request"""
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Records the metrics of the request"""
+    if not app.config["METRICS_ENABLED"] or "request_start" not in g:
+        return response
+    endpoint = request.endpoint or "unknown"
+    elapsed = time.perf_counter() - g.request_start
+    REQUESTS.inc((endpoint, request.method, response.status_code))
+    REQUEST_LATENCY.observe((endpoint, request.method), elapsed)
+    DB_QUERIES.observe((endpoint,), g.db_queries)
+    DB_QUERY_TIME.observe((endpoint,), g.db_seconds)
+    return response
+
+
+######################################################################
+# SQLAlchemy hooks
+######################################################################
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=too-many-arguments
+    """Starts measuring a SQL statement"""
+    context.query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=too-many-arguments
+    """Adds a SQL statement to the counters of the current request"""
+    if has_request_context() and "db_queries" in g:
+        g.db_queries += 1
+        g.db_seconds += time.perf_counter() - context.query_start
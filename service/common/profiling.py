@@ -0,0 +1,135 @@
+"""
+Profiling
+
+This module runs a request under cProfile when PROFILING_ENABLED is set and
+the request carries an "X-Profile: 1" header. The profile is kept in memory
+with the SQL statements of the request and their timings, and can be read
+back from GET /profiles/<request_id>
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+from collections import OrderedDict
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from service import app
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_STATS_LINES = 40
+
+
+class ProfileStore:
+    """Keeps the most recent profiles by request id"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, request_id: str, profile: dict):
+        """Stores a profile and forgets the oldest ones"""
+        with self._lock:
+            self._profiles[request_id] = profile
+            while len(self._profiles) > self.size:
+                self._profiles.popitem(last=False)
+
+    def get(self, request_id: str):
+        """Returns a stored profile or None"""
+        with self._lock:
+            return self._profiles.get(request_id)
+
+
+profiles = ProfileStore(app.config["PROFILING_HISTORY"])
+
+
+def format_stats(profiler: cProfile.Profile) -> str:
+    """Returns the functions that took the most cumulative time"""
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_STATS_LINES)
+    return output.getvalue()
+
+
+######################################################################
+# Request hooks
+######################################################################
+@app.before_request
+def start_profiler():
+    """Starts profiling the request when asked to"""
+    if not app.config["PROFILING_ENABLED"]:
+        return
+    if request.headers.get(PROFILE_HEADER, "").lower() not in ("1", "true", "yes"):
+        return
+    g.sql_statements = []
+    g.profile_start = time.perf_counter()
+    g.profiler = cProfile.Profile()
+    g.profiler.enable()
+
+
+@app.after_request
+def store_profile(response):
+    """Stores the profile of the request"""
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    statements = g.pop("sql_statements")
+    seconds = time.perf_counter() - g.pop("profile_start")
+    profiles.add(
+        g.request_id,
+        {
+            "request_id": g.request_id,
+            "method": request.method,
+            "path": request.full_path,
+            "status": response.status_code,
+            "seconds": seconds,
+            "sql": statements,
+            "stats": format_stats(profiler),
+        },
+    )
+    app.logger.info(
+        "Profiled %s %s with %d SQL statements",
+        request.method,
+        request.path,
+        len(statements),
+    )
+    response.headers["X-Profile-URL"] = f"/profiles/{g.request_id}"
+    return response
+
+
+@app.teardown_request
+def stop_profiler(error=None):  # pylint: disable=unused-argument
+    """Stops the profiler of a request that failed before store_profile()
+
+    g can outlive the request in the app context pushed by init_db(), so
+    nothing of the profile is left behind in it.
+    """
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+    g.pop("sql_statements", None)
+    g.pop("profile_start", None)
+
+
+######################################################################
+# SQLAlchemy hooks
+######################################################################
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=too-many-arguments
+    """Starts timing a SQL statement of a profiled request"""
+    context.profile_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_statement(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=too-many-arguments
+    """Records a SQL statement of a profiled request"""
+    if has_request_context() and "profiler" in g:
+        g.sql_statements.append(
+            {
+                "statement": statement,
+                "seconds": time.perf_counter() - context.profile_start,
+            }
+        )
@@ -0,0 +1,99 @@
+"""
+Read Replica
+
+This module sends the reads of the read only routes to a replica of the
+database when REPLICA_DATABASE_URI is set, through the "replica" bind of
+SQLALCHEMY_BINDS. Writes, flushes and SELECT ... FOR UPDATE always go to
+the primary. A client that writes gets a cookie that keeps its reads on the
+primary for REPLICA_STICKY_SECONDS, so it reads its own writes while the
+replica catches up
+"""
+import math
+import time
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from werkzeug.http import dump_cookie
+from service import app
+
+REPLICA_BIND = "replica"
+STICKY_COOKIE = "read_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Routes that only read, they are served from the replica
+READ_ONLY_ENDPOINTS = (
+    "get_products",
+    "list_products",
+    "search_products",
+    "get_facets",
+    "get_leaderboard",
+    "get_changes",
+)
+
+
+def is_sticky(value) -> bool:
+    """Checks if the value of the sticky cookie keeps a client on the primary"""
+    try:
+        return float(value) > time.time()
+    except (TypeError, ValueError):
+        return False
+
+
+def sticky_cookie(seconds: float) -> str:
+    """Returns the Set-Cookie header that keeps a client on the primary"""
+    return dump_cookie(
+        STICKY_COOKIE,
+        f"{time.time() + seconds:.3f}",
+        max_age=math.ceil(seconds),
+        httponly=True,
+        samesite="Lax",
+    )
+
+
+def reads_from_replica() -> bool:
+    """Checks if the current request reads from the replica"""
+    return has_request_context() and g.get("read_replica", False)
+
+
+def writes(clause) -> bool:
+    """Checks if a statement writes or locks rows"""
+    return clause is not None and (
+        getattr(clause, "is_dml", False) or getattr(clause, "_for_update_arg", None) is not None
+    )
+
+
+class ReplicaSession(Session):
+    """A Flask-SQLAlchemy session that reads from the replica when it can"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # pylint: disable=protected-access
+        if bind is None and not self._flushing and reads_from_replica() and not writes(clause):
+            engines = self._db.engines
+            if REPLICA_BIND in engines:
+                return engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+######################################################################
+# Request hooks
+######################################################################
+@app.before_request
+def choose_database():
+    """Sends the reads of read only requests to the replica"""
+    g.read_replica = (
+        bool(app.config["REPLICA_DATABASE_URI"])
+        and request.method in SAFE_METHODS
+        and request.endpoint in READ_ONLY_ENDPOINTS
+        and not is_sticky(request.cookies.get(STICKY_COOKIE))
+    )
+
+
+@app.after_request
+def keep_writer_on_primary(response):
+    """Keeps the reads of a client that wrote on the primary for a while"""
+    if (
+        app.config["REPLICA_DATABASE_URI"]
+        and request.method not in SAFE_METHODS
+        and response.status_code < 400
+    ):
+        response.headers.add("Set-Cookie", sticky_cookie(app.config["REPLICA_STICKY_SECONDS"]))
+    return response
@@ -0,0 +1,110 @@
+"""
+Search Index
+
+This module contains the in-process prefix index of product names used for
+search when the database has no trigram or full-text index, i.e. on SQLite.
+Every word of every name is kept in a sorted array, so the names with a word
+starting with a prefix are found with a binary search
+"""
+import bisect
+import heapq
+import re
+import threading
+
+WORDS = re.compile(r"\w+")
+
+
+def words(text: str) -> list:
+    """Returns the lower case words of a text"""
+    return WORDS.findall(text.lower())
+
+
+class PrefixIndex:
+    """A sorted array of (word, product id) pairs
+
+    The index is loaded on first use and then kept up to date by add() and
+    discard(). Each worker process has its own copy.
+    """
+
+    def __init__(self):
+        self._names = {}
+        self._words = []
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, names):
+        """Replaces the index with an iterable of (product id, name) pairs"""
+        with self._lock:
+            self._names = dict(names)
+            self._words = sorted(
+                (word, product_id)
+                for product_id, name in self._names.items()
+                for word in words(name)
+            )
+            self.loaded = True
+
+    def add(self, product_id: int, name: str):
+        """Indexes the name of a new or updated product"""
+        with self._lock:
+            if not self.loaded:
+                return
+            self._remove(product_id)
+            self._names[product_id] = name
+            for word in words(name):
+                bisect.insort(self._words, (word, product_id))
+
+    def discard(self, product_id: int):
+        """Removes a deleted product"""
+        with self._lock:
+            if self.loaded:
+                self._remove(product_id)
+
+    def clear(self):
+        """Empties the index, it is loaded again on next use"""
+        with self._lock:
+            self._names = {}
+            self._words = []
+            self.loaded = False
+
+    def search(self, text: str, limit: int) -> list:
+        """Returns the ids of the best ``limit`` names matching a text
+
+        Every word of the text must be the prefix of a word of the name.
+        Names starting with the whole text rank first, then shorter names.
+        """
+        tokens = words(text)
+        if not tokens:
+            return []
+        # the longest token is usually the most selective one, the names it
+        # finds are then checked for the other tokens directly
+        tokens.sort(key=len, reverse=True)
+        with self._lock:
+            found = set()
+            index = bisect.bisect_left(self._words, (tokens[0],))
+            while index < len(self._words) and self._words[index][0].startswith(tokens[0]):
+                found.add(self._words[index][1])
+                index += 1
+            names = {product_id: self._names[product_id].lower() for product_id in found}
+        for token in tokens[1:]:
+            names = {
+                product_id: name
+                for product_id, name in names.items()
+                if any(word.startswith(token) for word in words(name))
+            }
+        prefix = text.strip().lower()
+
+        def rank(product_id):
+            name = names[product_id]
+            return not name.startswith(prefix), len(name), product_id
+
+        return heapq.nsmallest(limit, names, key=rank)
+
+    def _remove(self, product_id: int):
+        """Removes the words of a product, the lock must be held"""
+        name = self._names.pop(product_id, None)
+        if name is None:
+            return
+        for word in words(name):
+            index = bisect.bisect_left(self._words, (word, product_id))
+            if index < len(self._words) and self._words[index] == (word, product_id):
+                del self._words[index]
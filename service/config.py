@@ -12,5 +12,98 @@ DATABASE_URI = os.getenv(
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Create the missing tables when a worker boots. Deployments turn this off
+# and run "flask db-init" once instead, so workers start without touching
+# the database and connect on their first request
+DB_AUTO_CREATE = os.getenv("DB_AUTO_CREATE", "true").lower() in ("true", "1", "yes")
+
+# Read replica of the read only routes, empty to read from the primary. A
+# client reads from the primary for REPLICA_STICKY_SECONDS after it writes
+REPLICA_DATABASE_URI = os.getenv("REPLICA_DATABASE_URI", "")
+SQLALCHEMY_BINDS = {"replica": REPLICA_DATABASE_URI} if REPLICA_DATABASE_URI else {}
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+
+# SQLite ("sqlite://" in memory or "sqlite:////path/to/file.db") needs no
+# server, file databases use this journal mode
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+
+# Connection pool of each worker, see service/common/db_pool.py
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("true", "1", "yes")
+# Milliseconds before PostgreSQL cancels a statement, 0 for no limit
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "0"))
+
+# Keyset pagination for GET /products
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# Rows fetched per round trip when streaming GET /products
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+
+# Budget of a GET /products response without limit, 0 for no limit. Larger
+# lists are streamed as a JSON array (OVER_BUDGET=stream) or refused with
+# 413 and a link to the first page (OVER_BUDGET=reject)
+MAX_RESPONSE_ROWS = int(os.getenv("MAX_RESPONSE_ROWS", "10000"))
+MAX_RESPONSE_BYTES = int(os.getenv("MAX_RESPONSE_BYTES", str(8 * 1024 * 1024)))
+OVER_BUDGET = os.getenv("OVER_BUDGET", "stream")
+
+# Bulk create with POST /products:batch
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "10000"))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "1000"))
+
+# Buffer likes in memory and write them every LIKE_FLUSH_INTERVAL seconds
+LIKE_WRITE_BEHIND = os.getenv("LIKE_WRITE_BEHIND", "false").lower() in ("true", "1", "yes")
+LIKE_FLUSH_INTERVAL = float(os.getenv("LIKE_FLUSH_INTERVAL", "1.0"))
+
+# Cache of GET /products/<id>: "memory", "none" or "module:ClassName"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "5.0"))
+
+# Record request and database metrics for GET /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("true", "1", "yes")
+
+# Share of requests whose peak memory is traced with tracemalloc, 0 to 1
+MEMORY_SAMPLE_RATE = float(os.getenv("MEMORY_SAMPLE_RATE", "0.01"))
+
+# Profile requests sent with "X-Profile: 1", never enable in production
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("true", "1", "yes")
+PROFILING_HISTORY = int(os.getenv("PROFILING_HISTORY", "20"))
+
+# Database of the asyncio entry point selected by SERVER_MODE=asgi in
+# gunicorn.conf.py, defaults to DATABASE_URI with its async driver
+# (asyncpg or aiosqlite)
+ASYNC_DATABASE_URI = os.getenv("ASYNC_DATABASE_URI", "")
+
+# Most liked products kept per category and seconds between reloads
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10"))
+LEADERBOARD_TTL = float(os.getenv("LEADERBOARD_TTL", "60.0"))
+
+# Facet counts cached per set of filters and seconds they are kept
+FACETS_CACHE_SIZE = int(os.getenv("FACETS_CACHE_SIZE", "256"))
+FACETS_CACHE_TTL = float(os.getenv("FACETS_CACHE_TTL", "10.0"))
+
+# Default and largest number of search results
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "10"))
+MAX_SEARCH_LIMIT = int(os.getenv("MAX_SEARCH_LIMIT", "100"))
+
+# Change feed of GET /products/changes: changes per response, the longest
+# wait of a long poll and how often it checks, and the seconds after which
+# a gap in the sequence is taken for a rolled back write. "flask
+# changes-prune" deletes the changes older than CHANGES_RETENTION_DAYS.
+# Long polls are off by default: a waiting request holds a sync worker, so
+# only set MAX_CHANGES_WAIT with SERVER_MODE=asgi or threaded workers
+CHANGES_LIMIT = int(os.getenv("CHANGES_LIMIT", "1000"))
+MAX_CHANGES_WAIT = float(os.getenv("MAX_CHANGES_WAIT", "0"))
+CHANGES_POLL_INTERVAL = float(os.getenv("CHANGES_POLL_INTERVAL", "0.5"))
+CHANGES_SETTLE_SECONDS = float(os.getenv("CHANGES_SETTLE_SECONDS", "2.0"))
+CHANGES_RETENTION_DAYS = int(os.getenv("CHANGES_RETENTION_DAYS", "7"))
+
+# JSON encoder: "auto" (orjson when installed), "default", "orjson" or "module:Class"
+JSON_PROVIDER = os.getenv("JSON_PROVIDER", "auto")
+
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "s3cr3t-key-shhhh")
@@ -4,15 +4,25 @@ Models for YourResourceModel
 All of the models are stored in this module
 """
 import logging
+import operator
 from enum import Enum
-from datetime import date
+from datetime import date, datetime, timedelta, timezone
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, bindparam, case, cast, func, literal, literal_column, or_, select, tuple_
+from sqlalchemy import DDL, delete, event, insert, text, type_coerce, union_all, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from service.common.cache import NullCache, create_cache
+from service.common.db_pool import configure_sqlite, engine_options
+from service.common.replica import ReplicaSession, reads_from_replica
+from service.common.search_index import PrefixIndex, words
 
 logger = logging.getLogger("flask.app")
 
 # Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": ReplicaSession})
 
 
 # Function to initialize the database
@@ -25,6 +35,10 @@ class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
+class ChangesPruned(Exception):
+    """Used when the changes a consumer asks for are no longer kept"""
+
+
 class Color(Enum):
     """Enumeration of valid Product Colors"""
 
@@ -76,23 +90,181 @@ class Category(Enum):
     """
 
 
+def _parse_bool(value: str) -> bool:
+    """Parses a query string boolean"""
+    if value.lower() in ("true", "1", "yes"):
+        return True
+    if value.lower() in ("false", "0", "no"):
+        return False
+    raise ValueError(f"invalid boolean '{value}'")
+
+
+def _utcnow() -> datetime:
+    """Returns the current UTC time without a time zone, as stored"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _parse_timestamp(value: str) -> datetime:
+    """Parses an ISO 8601 time into a UTC time without a time zone"""
+    timestamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _isoformat(column):
+    """Returns a DateTime column as the text of datetime.isoformat()"""
+    if db.engine.dialect.name == "postgresql":
+        return func.to_char(column, 'YYYY-MM-DD"T"HH24:MI:SS.US')
+    # SQLite stores the text "YYYY-MM-DD HH:MM:SS.ffffff"
+    return func.replace(column, " ", "T")
+
+
+def _enum_parser(enum: type):
+    """Returns a parser of query string values into an Enum"""
+
+    def parse(value: str):
+        try:
+            return enum[value.upper()]
+        except KeyError as error:
+            raise ValueError(f"invalid {enum.__name__} '{value}'") from error
+
+    return parse
+
+
+# Query parameters accepted by Product.find_by_filters():
+#   parameter -> (column name, comparison, parser)
+FILTERS = {
+    "name": ("name", operator.eq, str),
+    "category": ("category", operator.eq, _enum_parser(Category)),
+    "color": ("color", operator.eq, _enum_parser(Color)),
+    "size": ("size", operator.eq, _enum_parser(Size)),
+    "available": ("available", operator.eq, _parse_bool),
+    "like_min": ("like", operator.ge, int),
+    "like_max": ("like", operator.le, int),
+    "create_date": ("create_date", operator.eq, date.fromisoformat),
+    "create_date_min": ("create_date", operator.ge, date.fromisoformat),
+    "create_date_max": ("create_date", operator.le, date.fromisoformat),
+    "last_modify_date": ("last_modify_date", operator.eq, date.fromisoformat),
+    "last_modify_date_min": ("last_modify_date", operator.ge, date.fromisoformat),
+    "last_modify_date_max": ("last_modify_date", operator.le, date.fromisoformat),
+    "updated_since": ("updated_at", operator.ge, _parse_timestamp),
+}
+
+
+def _json_bool(value) -> bool:
+    """Parses a JSON boolean"""
+    if not isinstance(value, bool):
+        raise TypeError(f"invalid boolean {value!r}")
+    return value
+
+
+def _json_int(value) -> int:
+    """Parses a JSON integer"""
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise TypeError(f"invalid integer {value!r}")
+    return value
+
+
+def _json_name(value) -> str:
+    """Parses a JSON string that fits the name column"""
+    max_length = Product.__table__.c.name.type.length
+    if not isinstance(value, str) or len(value) > max_length:
+        raise TypeError(f"must be a string of at most {max_length} characters, not {value!r}")
+    return value
+
+
+# Fields that can be set by Product.bulk_update(): field -> parser
+UPDATABLE_FIELDS = {
+    "name": _json_name,
+    "available": _json_bool,
+    "like": _json_int,
+    "category": _enum_parser(Category),
+    "color": _enum_parser(Color),
+    "size": _enum_parser(Size),
+    "create_date": date.fromisoformat,
+    "last_modify_date": date.fromisoformat,
+}
+
+
+def _with_tiebreak(sort: tuple) -> tuple:
+    """Adds the id, in the direction of the last field, to a sort order"""
+    return sort + (("id", sort[-1][1] if sort else False),)
+
+
+# Fields counted by Product.facets()
+FACETS = ("category", "color", "size", "available")
+
+# Fields written by Product.serialize(), in the order of Product.rows()
+SERIALIZED_FIELDS = (
+    "id",
+    "name",
+    "available",
+    "like",
+    "category",
+    "color",
+    "size",
+    "create_date",
+    "last_modify_date",
+    "updated_at",
+)
+
+# Value of updated_at for the Products written before it was added
+UPDATED_AT_UNKNOWN = "1970-01-01 00:00:00.000000"
+
+
 # pylint: disable=too-many-instance-attributes
 class Product(db.Model):
     """This class defines a product"""
 
+    # Indexes for the hot filter columns. They are created by db.create_all()
+    # on new databases and by "flask db-upgrade" on existing ones.
+    __table_args__ = (
+        db.Index("ix_product_name", "name"),
+        db.Index("ix_product_category_available", "category", "available"),
+        # serves ?category=...&sort=-like pages straight from the index
+        db.Index("ix_product_category_like", "category", "like", "id"),
+        db.Index("ix_product_create_date", "create_date"),
+        db.Index("ix_product_last_modify_date", "last_modify_date"),
+        # serves the ?updated_since=...&sort=updated_at pages of the mirrors
+        db.Index("ix_product_updated_at", "updated_at", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(63), nullable=False)
     available = db.Column(db.Boolean(), nullable=False, default=False)
     like = db.Column(db.Integer, nullable=False, default=0)
-    category = db.Column(db.Enum(Category), nullable=False, server_default=Category.UNKNOWN.name)
-    color = db.Column(db.Enum(Color), nullable=False, server_default=Color.UNKNOWN.name)
-    size = db.Column(db.Enum(Size), nullable=False, server_default=Size.UNKNOWN.name)
-    create_date = db.Column(db.Date(), nullable=False, default=date.today())
-    last_modify_date = db.Column(db.Date(), nullable=False, default=date.today())
+    category = db.Column(db.Enum(Category, create_constraint=True), nullable=False, server_default=Category.UNKNOWN.name)
+    color = db.Column(db.Enum(Color, create_constraint=True), nullable=False, server_default=Color.UNKNOWN.name)
+    size = db.Column(db.Enum(Size, create_constraint=True), nullable=False, server_default=Size.UNKNOWN.name)
+    create_date = db.Column(db.Date(), nullable=False, default=date.today)
+    last_modify_date = db.Column(db.Date(), nullable=False, default=date.today)
+    # set by the service on every write, ORM or not, for incremental syncs
+    updated_at = db.Column(
+        db.DateTime(),
+        nullable=False,
+        default=_utcnow,
+        onupdate=_utcnow,
+        server_default=UPDATED_AT_UNKNOWN,
+    )
+    # bumped on every write, used for ETags and optimistic concurrency
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
+
+    # Serialized Products by id, replaced in init_db()
+    cache = NullCache({})
+    # Names for search on databases without the PostgreSQL search indexes
+    name_index = PrefixIndex()
 
     def __repr__(self):
         return f"<Product {self.name} id=[{self.id}]>"
 
+    @property
+    def etag(self) -> str:
+        """Returns the entity tag of this version of the Product"""
+        return f"{self.id}-{self.version}"
+
     def create(self):
         """Creates a Product to the database"""
         logger.info("Creating %s", self.name)
@@ -100,19 +272,80 @@ class Product(db.Model):
         self.id = None  # pylint: disable=invalid-name
         db.session.add(self)
         db.session.commit()
+        self.cache.delete(self.id)
+        self.name_index.add(self.id, self.name)
 
     def update(self):
         """
         Updates a Product to the database
         """
         logger.info("Saving %s", self.name)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except StaleDataError:
+            # another request changed the Product since it was read
+            db.session.rollback()
+            raise
+        self.cache.delete(self.id)
+        self.name_index.add(self.id, self.name)
 
     def delete(self):
-        """Removes a Product from the data store"""
+        """Removes a Product from the data store
+
+        The row is deleted by id whatever its version, so a like or update
+        that landed since the Product was read does not fail the delete.
+        """
         logger.info("Deleting %s", self.name)
-        db.session.delete(self)
+        product_id = self.id
+        db.session.expunge(self)
+        row = db.session.execute(self.delete_statement(product_id)).first()
+        if row:
+            ProductChange.append(db.session, [(product_id, "delete", row.version)])
         db.session.commit()
+        self.cache.delete(product_id)
+        self.name_index.discard(product_id)
+
+    @classmethod
+    def delete_statement(cls, product_id: int):
+        """Returns the DELETE of a Product by id, returning its last version"""
+        return (
+            delete(cls)
+            .where(cls.id == product_id)
+            .returning(cls.version)
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def bulk_create(products: list) -> list:
+        """Creates a list of Products in a single transaction
+
+        The Products are flushed together so SQLAlchemy sends them as
+        multi-row INSERT ... RETURNING statements instead of one round
+        trip per Product.
+
+        :param products: the Products to create
+        :type products: list
+
+        :return: the ids of the new Products in the same order
+        :rtype: list
+
+        """
+        logger.info("Creating a batch of %d products", len(products))
+        for product in products:
+            product.id = None
+        db.session.add_all(products)
+        try:
+            db.session.flush()
+            # read the ids before the commit expires the instances
+            ids = [product.id for product in products]
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            raise
+        for product_id, product in zip(ids, products):
+            Product.cache.delete(product_id)
+            Product.name_index.add(product_id, product.name)
+        return ids
 
     def serialize(self) -> dict:
         """Serializes a Product into a dictionary"""
@@ -126,8 +359,48 @@ class Product(db.Model):
             "size": self.size.name,
             "create_date": self.create_date.isoformat(),
             "last_modify_date": self.last_modify_date.isoformat(),
+            "updated_at": self.updated_at.isoformat(timespec="microseconds") if self.updated_at else None,
         }
 
+    @staticmethod
+    def serialize_row(row, fields: tuple = SERIALIZED_FIELDS) -> dict:
+        """Serializes a row of Product.rows() into a dictionary"""
+        return dict(zip(fields, row))
+
+    @classmethod
+    def rows(cls, query, fields: tuple = SERIALIZED_FIELDS, extra: tuple = ()):
+        """Returns a Product query that yields plain rows instead of Products
+
+        The database returns the values the way serialize() writes them,
+        enums as their names and dates as ISO strings, so read-only lists
+        can be encoded without building a Product per row. Only the columns
+        of ``fields`` are read; each row also carries the ``extra`` fields,
+        the id and the version after them for cursors and ETags.
+
+        :param query: the Product query to read
+        :param fields: the serialized fields to select
+        :param extra: more fields to select without serializing them
+
+        """
+        return query.with_entities(*cls.row_columns(fields, extra))
+
+    @classmethod
+    def row_columns(cls, fields: tuple = SERIALIZED_FIELDS, extra: tuple = ()) -> list:
+        """Returns the columns selected by rows(), for select() statements"""
+        columns = []
+        for name in dict.fromkeys(fields + extra):
+            column = getattr(cls, name)
+            if isinstance(column.type, db.Enum):
+                column = type_coerce(column, db.String)
+            elif isinstance(column.type, db.Date):
+                column = cast(column, db.String)
+            elif isinstance(column.type, db.DateTime):
+                column = _isoformat(column)
+            columns.append(column.label(name))
+        if "id" not in fields:
+            columns.append(cls.id)
+        return columns + [cls.version]
+
     def deserialize(self, data: dict):
         """
         Deserializes a Product from a dictionary
@@ -137,6 +410,11 @@ class Product(db.Model):
         """
         try:
             self.name = data["name"]
+            max_length = self.__table__.c.name.type.length
+            if not isinstance(self.name, str) or len(self.name) > max_length:
+                raise DataValidationError(
+                    f"Invalid name: must be a string of at most {max_length} characters"
+                )
             # self.category = data["category"]
             if isinstance(data["available"], bool):
                 self.available = data["available"]
@@ -145,7 +423,7 @@ class Product(db.Model):
                     "Invalid type for boolean [available]: "
                     + str(type(data["available"]))
                 )
-            self.like = data["like"]
+            self.like = _json_int(data["like"])
             self.color = getattr(Color, data["color"])  # create enum from string
             self.size = getattr(Size, data["size"])
             self.category = getattr(Category, data["category"])
@@ -162,6 +440,8 @@ class Product(db.Model):
                 "Invalid product: body of request contained bad or no data "
                 + str(error)
             ) from error
+        except ValueError as error:
+            raise DataValidationError("Invalid value: " + str(error)) from error
         return self
 
     ##################################################
@@ -173,10 +453,18 @@ class Product(db.Model):
         """Initializes the database session"""
         logger.info("Initializing database")
         cls.app = app
+        cls.cache = create_cache(app.config)
+        cls.name_index.clear()
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app)
         app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+        for engine in db.engines.values():
+            configure_sqlite(engine, app.config)
+        # the engine connects on first use, so without DB_AUTO_CREATE no
+        # connection is opened until the first request
+        if app.config.get("DB_AUTO_CREATE", True):
+            db.create_all()  # make our sqlalchemy tables
 
     @classmethod
     def all(cls) -> list:
@@ -184,12 +472,460 @@ class Product(db.Model):
         logger.info("Processing all Products")
         return cls.query.all()
 
+    @classmethod
+    def filter_criteria(cls, filters: dict) -> list:
+        """Returns the SQL criteria for a set of query parameters
+
+        Parameters that are not listed in FILTERS are ignored so the
+        request arguments can be passed in as they are.
+
+        :param filters: query parameters such as ``{"color": "RED"}``
+        :type filters: dict
+
+        :return: a list of SQLAlchemy criteria
+        :rtype: list
+
+        """
+        criteria = []
+        for param, value in filters.items():
+            if param not in FILTERS:
+                continue
+            column, compare, parse = FILTERS[param]
+            try:
+                criteria.append(compare(getattr(cls, column), parse(value)))
+            except (TypeError, ValueError) as error:
+                raise DataValidationError(
+                    f"Invalid filter {param}: {error}"
+                ) from error
+        return criteria
+
+    @classmethod
+    def find_by_filters(cls, filters: dict):
+        """Returns all Products matching every one of the filters
+
+        All of the filters are combined into a single query so they are
+        evaluated by the database in one round trip.
+
+        :param filters: query parameters such as ``{"color": "RED"}``
+        :type filters: dict
+
+        :return: a query of the matching Products
+
+        """
+        logger.info("Processing filter query for %s ...", dict(filters))
+        return cls.query.filter(*cls.filter_criteria(filters))
+
+    @classmethod
+    def parse_values(cls, data: dict) -> dict:
+        """Validates the column values of a bulk update
+
+        :param data: new values such as ``{"available": False}``
+        :type data: dict
+
+        :return: the values converted to column types
+        :rtype: dict
+
+        """
+        if not isinstance(data, dict) or not data:
+            raise DataValidationError("Invalid update: no values to set")
+        values = {}
+        for field, value in data.items():
+            if field not in UPDATABLE_FIELDS:
+                raise DataValidationError(f"Invalid update: unknown field {field}")
+            try:
+                values[getattr(cls, field)] = UPDATABLE_FIELDS[field](value)
+            except (AttributeError, TypeError, ValueError) as error:
+                raise DataValidationError(
+                    f"Invalid update of {field}: {error}"
+                ) from error
+        return values
+
+    @classmethod
+    def bulk_update(cls, criteria: list, values: dict) -> int:
+        """Updates every Product matching the criteria with one UPDATE statement
+
+        :param criteria: the SQLAlchemy criteria selecting the Products
+        :param values: the new column values from parse_values()
+
+        :return: the number of Products updated
+        :rtype: int
+
+        """
+        logger.info("Processing bulk update of %s ...", list(values))
+        values = {**values, cls.version: cls.version + 1}
+        statement = (
+            update(cls)
+            .where(*criteria)
+            .values(values)
+            .returning(cls.id, cls.version)
+            .execution_options(synchronize_session=False)
+        )
+        rows = db.session.execute(statement).all()
+        ProductChange.append(db.session, [(row.id, "update", row.version) for row in rows])
+        db.session.commit()
+        cls.cache.clear()
+        if cls.name in values:
+            cls.name_index.clear()
+        return len(rows)
+
+    @classmethod
+    def bulk_delete(cls, criteria: list) -> int:
+        """Deletes every Product matching the criteria with one DELETE statement
+
+        :param criteria: the SQLAlchemy criteria selecting the Products
+
+        :return: the number of Products deleted
+        :rtype: int
+
+        """
+        logger.info("Processing bulk delete ...")
+        statement = (
+            delete(cls)
+            .where(*criteria)
+            .returning(cls.id, cls.version)
+            .execution_options(synchronize_session=False)
+        )
+        rows = db.session.execute(statement).all()
+        ProductChange.append(db.session, [(row.id, "delete", row.version) for row in rows])
+        db.session.commit()
+        cls.cache.clear()
+        cls.name_index.clear()
+        return len(rows)
+
+    @classmethod
+    def increment_like(cls, product_id: int, likes: int = 1):
+        """Atomically adds likes to a Product
+
+        The counter is incremented by the database with a single
+        UPDATE ... SET like = like + :likes ... RETURNING statement, so
+        concurrent likes are never lost and no prior SELECT is needed.
+
+        :param product_id: the id of the Product to like
+        :param likes: the number of likes to add
+
+        :return: the updated Product, or None if it does not exist
+        :rtype: Product
+
+        """
+        logger.info("Processing like of id %s ...", product_id)
+        table = cls.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == product_id)
+            .values(like=table.c.like + likes, version=table.c.version + 1)
+            .returning(*table.c)
+        )
+        row = db.session.execute(statement).first()
+        if row:
+            ProductChange.append(db.session, [(row.id, "like", row.version)])
+        db.session.commit()
+        cls.cache.delete(product_id)
+        # a detached copy built from the returned row, read without a SELECT
+        return cls(**row._mapping) if row else None
+
+    @classmethod
+    def add_likes(cls, likes: dict):
+        """Adds aggregated likes to many Products in one executemany UPDATE
+
+        :param likes: the number of likes to add per Product id
+        :type likes: dict
+
+        """
+        logger.info("Processing likes of %d products ...", len(likes))
+        table = cls.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("product_id"))
+            .values(
+                like=table.c.like + bindparam("likes"), version=table.c.version + 1
+            )
+        )
+        db.session.execute(
+            statement,
+            [
+                {"product_id": product_id, "likes": count}
+                for product_id, count in likes.items()
+            ],
+        )
+        # executemany returns no rows, read the new versions back
+        rows = db.session.execute(
+            select(table.c.id, table.c.version).where(table.c.id.in_(list(likes)))
+        )
+        ProductChange.append(db.session, [(row.id, "like", row.version) for row in rows])
+        db.session.commit()
+        for product_id in likes:
+            cls.cache.delete(product_id)
+
+    @classmethod
+    def parse_sort(cls, sort: str) -> tuple:
+        """Parses a sort order such as ``"like,-create_date"``
+
+        :param sort: comma separated fields, descending when prefixed by "-"
+        :type sort: str
+
+        :return: the ``(field, descending)`` pairs of the sort order
+        :rtype: tuple
+
+        """
+        order = {}
+        for key in sort.split(","):
+            key = key.strip()
+            name = key.lstrip("-")
+            if not key:
+                continue
+            if name not in SERIALIZED_FIELDS or name in order or key.startswith("--"):
+                raise DataValidationError(
+                    f"Invalid sort '{sort}', choose from {', '.join(SERIALIZED_FIELDS)}"
+                )
+            order[name] = key.startswith("-")
+        return tuple(order.items())
+
+    @classmethod
+    def sort_clauses(cls, sort: tuple = ()) -> list:
+        """Returns the ORDER BY clauses of a sort order
+
+        Ties are broken by id in the direction of the last field so that
+        the order is total and a page can be found with one row comparison.
+        """
+        clauses = []
+        for name, descending in _with_tiebreak(sort):
+            column = getattr(cls, name)
+            clauses.append(column.desc() if descending else column.asc())
+        return clauses
+
+    @classmethod
+    def after_criteria(cls, sort: tuple, values: list, after_id: int):
+        """Returns the criteria of the rows that sort after a position
+
+        :param sort: the ``(field, descending)`` pairs of the sort order
+        :param values: the sort fields of the last row, as Product.rows()
+            returns them
+        :param after_id: the id of the last row
+
+        """
+        keys = [(getattr(cls, name), descending) for name, descending in _with_tiebreak(sort)]
+        try:
+            values = [
+                cls.sort_value(name, value) for (name, _), value in zip(sort, values)
+            ] + [after_id]
+        except (KeyError, TypeError, ValueError) as error:
+            raise DataValidationError(f"Invalid sort position: {error}") from error
+        binds = [bindparam(None, value, type_=column.type) for (column, _), value in zip(keys, values)]
+
+        directions = {descending for _, descending in keys}
+        if len(directions) == 1:
+            # a single row comparison can be answered by one index range scan
+            columns = tuple_(*[column for column, _ in keys])
+            return columns < tuple_(*binds) if directions.pop() else columns > tuple_(*binds)
+        criteria = []
+        for index, (column, descending) in enumerate(keys):
+            equal = [keys[i][0] == binds[i] for i in range(index)]
+            beyond = column < binds[index] if descending else column > binds[index]
+            criteria.append(and_(*equal, beyond))
+        return or_(*criteria)
+
+    @classmethod
+    def sort_value(cls, name: str, value):
+        """Converts a serialized field value back to its column type"""
+        column = getattr(cls, name)
+        if isinstance(column.type, db.Enum):
+            return column.type.enum_class[value]
+        if isinstance(column.type, db.Date):
+            return date.fromisoformat(value)
+        if isinstance(column.type, db.DateTime):
+            return datetime.fromisoformat(value)
+        python_type = column.type.python_type
+        # bool is an int too, so it is told apart from the other types
+        if isinstance(value, bool) != (python_type is bool) or not isinstance(value, python_type):
+            raise TypeError(f"invalid {name} {value!r}")
+        return value
+
+    @classmethod
+    def find_page(cls, query, limit: int, after: tuple = None, sort: tuple = ()) -> list:
+        """Returns one page of a Product query using keyset pagination
+
+        Rows are ordered by the sort fields and id and the page starts
+        right after the ``after`` position, so the database seeks straight
+        to the page through an index instead of skipping rows with OFFSET.
+
+        :param query: the Product query to paginate
+        :param limit: the number of Products in a page
+        :param after: the sort values and id of the last Product of the
+            previous page
+        :param sort: the ``(field, descending)`` pairs of the sort order
+
+        :return: up to ``limit + 1`` Products, the extra one tells the
+            caller that there is a next page
+        :rtype: list
+
+        """
+        logger.info("Processing page query of %s after %s ...", limit, after)
+        return cls.page_query(query, limit, after, sort).all()
+
+    @classmethod
+    def page_query(cls, query, limit: int, after: tuple = None, sort: tuple = ()):
+        """Returns the query or select() statement of find_page()"""
+        if after is not None:
+            query = query.filter(cls.after_criteria(sort, *after))
+        return query.order_by(*cls.sort_clauses(sort)).limit(limit + 1)
+
+    @classmethod
+    def stream(cls, query, batch_size: int = 1000, sort: tuple = ()):
+        """Returns an iterator over a Product query backed by a server-side cursor
+
+        Rows are fetched ``batch_size`` at a time so memory use does not
+        grow with the size of the table.
+
+        :param query: the Product query to stream
+        :param batch_size: the number of rows fetched per round trip
+        :param sort: the ``(field, descending)`` pairs of the sort order
+
+        """
+        logger.info("Processing stream query in batches of %s ...", batch_size)
+        return query.order_by(*cls.sort_clauses(sort)).yield_per(batch_size)
+
+    @classmethod
+    def facets(cls, filters: dict) -> dict:
+        """Counts the Products matching the filters by each of the FACETS
+
+        The GROUP BY of every facet is combined with UNION ALL so all the
+        counts come back in a single query.
+
+        :param filters: query parameters such as ``{"color": "RED"}``
+        :type filters: dict
+
+        :return: the counts of every value, such as
+            ``{"color": {"RED": 2}, "available": {"true": 1, "false": 1}}``
+        :rtype: dict
+
+        """
+        logger.info("Processing facet query for %s ...", dict(filters))
+        criteria = cls.filter_criteria(filters)
+        selects = []
+        for name in FACETS:
+            column = getattr(cls, name)
+            if isinstance(column.type, db.Enum):
+                value = type_coerce(column, db.String)
+            else:
+                value = case((column, "true"), else_="false")
+            selects.append(
+                select(literal(name).label("facet"), value.label("value"), func.count())
+                .where(*criteria)
+                .group_by(column)
+            )
+        counts = {name: {} for name in FACETS}
+        for facet, value, count in db.session.execute(union_all(*selects)):
+            counts[facet][value] = count
+        return counts
+
+    @classmethod
+    def search(cls, terms: str, limit: int) -> list:
+        """Returns the serialized Products best matching a search text
+
+        Every word of the terms must be the prefix of a word of the name.
+        On PostgreSQL the match is answered by the trigram and full-text
+        indexes of the name and ranked by prefix match, full-text rank and
+        similarity. Other databases use the in-process name_index.
+
+        :param terms: the words typed by the user
+        :param limit: the number of Products to return
+
+        """
+        logger.info("Processing search query for %s ...", terms)
+        tokens = words(terms)
+        if not tokens:
+            return []
+        if db.engine.dialect.name != "postgresql":
+            return cls._search_index(terms, limit)
+
+        name = func.lower(cls.name)
+        vector = func.to_tsvector(literal_column("'simple'"), cls.name)
+        query = func.to_tsquery(literal_column("'simple'"), " & ".join(f"{token}:*" for token in tokens))
+        prefix = name.startswith(terms.strip().lower(), autoescape=True)
+        rows = (
+            cls.rows(cls.query.filter(or_(prefix, vector.op("@@")(query))))
+            .order_by(
+                case((prefix, 0), else_=1),
+                func.ts_rank(vector, query).desc(),
+                func.similarity(name, terms.lower()).desc(),
+                cls.id,
+            )
+            .limit(limit)
+        )
+        return [cls.serialize_row(row) for row in rows]
+
+    @classmethod
+    def _search_index(cls, terms: str, limit: int) -> list:
+        """Searches the in-process name_index, loading it on first use"""
+        if not cls.name_index.loaded:
+            cls.name_index.load(db.session.query(cls.id, cls.name))
+        ids = cls.name_index.search(terms, limit)
+        found = {row.id: row for row in cls.rows(cls.query.filter(cls.id.in_(ids)))}
+        return [cls.serialize_row(found[product_id]) for product_id in ids if product_id in found]
+
+    @classmethod
+    def find_top(cls, category: str, count: int) -> list:
+        """Returns the most liked Products of a category, serialized
+
+        The (category, like, id) index returns them without sorting the
+        category.
+
+        :param category: the name of the Category
+        :param count: the number of Products to return
+
+        """
+        logger.info("Processing top %s query for %s ...", count, category)
+        query = cls.query.filter(cls.category == Category[category])
+        query = cls.rows(query).order_by(cls.like.desc(), cls.id.desc()).limit(count)
+        return [cls.serialize_row(row) for row in query]
+
     @classmethod
     def find(cls, product_id: int):
         """Finds a Product by it's ID"""
         logger.info("Processing lookup for id %s ...", product_id)
         return cls.query.get(product_id)
 
+    @classmethod
+    def find_cached(cls, product_id: int, fields: tuple = None) -> tuple:
+        """Finds a serialized Product by it's ID through the cache
+
+        :param product_id: the id of the Product to find
+        :type product_id: int
+        :param fields: the serialized fields to return, all when None
+        :type fields: tuple
+
+        :return: the entity tag, the serialized Product and the time of
+            its last write (updated_at, read even when it is not one of
+            the fields), or ``(None, None, None)`` if not found
+        :rtype: tuple
+
+        """
+        entry = cls.cache.get(product_id)
+        if entry is None and fields is not None:
+            # read only the requested columns, the cache keeps whole Products
+            query = cls.query.filter(cls.id == product_id)
+            row = cls.rows(query, fields, ("updated_at",)).first()
+            if row is None:
+                return None, None, None
+            return f"{row.id}-{row.version}", cls.serialize_row(row, fields), row.updated_at
+        if entry is None:
+            product = cls.find(product_id)
+            if product is None:
+                return None, None, None
+            entry = (product.etag, product.serialize())
+            if not reads_from_replica():
+                # a lagging replica must not put an old version in the cache
+                cls.cache.set(product_id, entry)
+        return cls.project(entry, fields)
+
+    @staticmethod
+    def project(entry: tuple, fields: tuple = None) -> tuple:
+        """Returns the result of find_cached() for an entry of the cache"""
+        etag, data = entry
+        if fields is not None:
+            return etag, {name: data[name] for name in fields}, data["updated_at"]
+        return etag, dict(data), data["updated_at"]
+
     @classmethod
     def find_or_404(cls, product_id: int):
         """Find a Product by it's id
@@ -293,3 +1029,167 @@ class Product(db.Model):
         """
         logger.info("Processing category query for %s ...", category.name)
         return cls.query.filter(cls.category == category)
+
+
+# Search indexes of the name, see Product.search(). They need the pg_trgm
+# extension and are only created on PostgreSQL.
+event.listen(
+    Product.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+db.Index(
+    "ix_product_name_trgm",
+    func.lower(Product.name).label("lower_name"),
+    postgresql_using="gin",
+    postgresql_ops={"lower_name": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
+db.Index(
+    "ix_product_name_fts",
+    func.to_tsvector(text("'simple'"), Product.name),
+    postgresql_using="gin",
+).ddl_if(dialect="postgresql")
+
+
+class ProductChange(db.Model):
+    """This class defines a write to a Product
+
+    Every create, update, delete and like of a Product appends a change in
+    the same transaction, numbered by ``seq`` in the order they were
+    written, so consumers follow the catalog with GET /products/changes
+    instead of reading every Product again.
+    """
+
+    __tablename__ = "product_change"
+    __table_args__ = (
+        db.Index("ix_product_change_changed_at", "changed_at"),
+        # never reuse the numbers of pruned changes
+        {"sqlite_autoincrement": True},
+    )
+
+    seq = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(16), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime(), nullable=False, default=_utcnow)
+
+    def serialize(self) -> dict:
+        """Serializes a ProductChange into a dictionary"""
+        return {
+            "seq": self.seq,
+            "id": self.product_id,
+            "op": self.op,
+            "version": self.version,
+            "changed_at": self.changed_at.isoformat(),
+        }
+
+    @staticmethod
+    def values(changes: list) -> list:
+        """Returns the rows to insert for ``(product id, op, version)`` changes"""
+        now = _utcnow()
+        return [
+            {"product_id": product_id, "op": op, "version": version, "changed_at": now}
+            for product_id, op, version in changes
+        ]
+
+    @classmethod
+    def append(cls, executor, changes: list):
+        """Appends changes with one executemany INSERT
+
+        :param executor: the Session or Connection of the transaction
+            that wrote the Products
+        :param changes: the ``(product id, op, version)`` of every write
+
+        """
+        if changes:
+            executor.execute(insert(cls.__table__), cls.values(changes))
+
+    @classmethod
+    def last_seq(cls) -> int:
+        """Returns the number of the last change, 0 when there is none"""
+        return db.session.query(func.max(cls.seq)).scalar() or 0
+
+    @classmethod
+    def find_since(cls, seq: int, limit: int, settle_seconds: float) -> list:
+        """Returns the changes after a sequence number, oldest first
+
+        Numbers are given when a change is written, not when it commits, so
+        a gap in the sequence may still be filled by a slow transaction. The
+        changes stop at a gap until the change after it is older than
+        ``settle_seconds``, after which the gap is taken for a rollback.
+
+        :param seq: the number of the last change already seen
+        :param limit: the most changes to return
+        :param settle_seconds: how long a gap may still be filled
+
+        :return: the changes in sequence order
+        :rtype: list
+
+        :raises ChangesPruned: when changes after seq were pruned
+
+        """
+        logger.info("Processing changes since %s ...", seq)
+        first_statement, statement = cls.since_statements(seq, limit)
+        first = db.session.scalar(first_statement)
+        changes = db.session.scalars(statement).all()
+        return cls.settled(changes, seq, first, settle_seconds)
+
+    @classmethod
+    def since_statements(cls, seq: int, limit: int) -> tuple:
+        """Returns the select() statements of find_since()
+
+        They read the first kept number and the changes after seq, so they
+        also run on other sessions such as the AsyncSession of service.asgi.
+        """
+        return (
+            select(func.min(cls.seq)),
+            select(cls).where(cls.seq > seq).order_by(cls.seq).limit(limit),
+        )
+
+    @staticmethod
+    def settled(changes: list, seq: int, first: int, settle_seconds: float) -> list:
+        """Returns the changes of find_since() up to the first unsettled gap
+
+        :raises ChangesPruned: when the first kept number is after seq + 1
+
+        """
+        if first is not None and seq + 1 < first:
+            raise ChangesPruned(f"Changes after {seq} are no longer kept, read the products again.")
+        settled_before = _utcnow() - timedelta(seconds=settle_seconds)
+        expected = seq + 1
+        for index, change in enumerate(changes):
+            if change.seq != expected and change.changed_at > settled_before:
+                return changes[:index]
+            expected = change.seq + 1
+        return changes
+
+    @classmethod
+    def prune(cls, before: datetime) -> int:
+        """Deletes the changes written before a time
+
+        :return: the number of changes deleted
+        :rtype: int
+
+        """
+        logger.info("Pruning changes before %s ...", before)
+        count = cls.query.filter(cls.changed_at < before).delete(synchronize_session=False)
+        db.session.commit()
+        return count
+
+
+@event.listens_for(Session, "after_flush")
+def record_product_changes(session, flush_context):  # pylint: disable=unused-argument
+    """Appends a change for every Product written by a flush
+
+    This covers the ORM writes of the Flask routes and of the ASGI entry
+    point. Statements that write without the ORM, such as the likes and
+    the batch updates, append their changes themselves.
+    """
+    changes = [(p.id, "create", p.version) for p in session.new if isinstance(p, Product)]
+    changes += [
+        (p.id, "update", p.version)
+        for p in session.dirty
+        if isinstance(p, Product) and session.is_modified(p)
+    ]
+    changes += [(p.id, "delete", p.version) for p in session.deleted if isinstance(p, Product)]
+    ProductChange.append(session.connection(), changes)
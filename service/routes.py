@@ -1,17 +1,43 @@
-
 """
 My Service
 
 Describe what your service does here
 """
 
-from flask import jsonify, request, url_for, abort
-from service.common import status  # HTTP Status Codes
-from service.models import Product
+import base64
+import binascii
+import hashlib
+import json
+import time
+from datetime import datetime, timezone
+
+from flask import Response, jsonify, request, url_for, abort, stream_with_context
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
+from service.common import memory, metrics, profiling, status  # HTTP Status Codes
+from service.common.db_pool import pool_stats
+from service.common.cache import LRUCache
+from service.common.leaderboard import Leaderboard
+from service.common.like_buffer import LikeBuffer
+from service.common.replica import REPLICA_BIND
+from service.models import Product, ProductChange, Category, DataValidationError, FILTERS, SERIALIZED_FIELDS, db
 
 # Import Flask application
 from . import app
 
+# Tries of a PUT without If-Match when other writes land between its read
+# and its write, the last write wins
+UPDATE_ATTEMPTS = 3
+
+# Likes buffered in memory when LIKE_WRITE_BEHIND is enabled
+like_buffer = LikeBuffer(app, Product.add_likes, app.config["LIKE_FLUSH_INTERVAL"])
+leaderboard = Leaderboard(
+    Product.find_top, app.config["LEADERBOARD_SIZE"], app.config["LEADERBOARD_TTL"]
+)
+facets_cache = LRUCache(
+    {"CACHE_SIZE": app.config["FACETS_CACHE_SIZE"], "CACHE_TTL": app.config["FACETS_CACHE_TTL"]}
+)
+
 
 ######################################################################
 # HEALTH CHECKPOINT
@@ -31,6 +57,61 @@ def index():
     return app.send_static_file('index.html')
 
 
+######################################################################
+# PROMETHEUS METRICS
+######################################################################
+@app.route("/metrics")
+def prometheus_metrics():
+    """Returns the service metrics in the Prometheus text format"""
+    pool = pool_stats(db.engine.pool)
+    cache = Product.cache.stats()
+    text = metrics.render(
+        metrics.gauge("db_pool_checked_out", "Connections in use", pool.get("checked_out", 0)),
+        metrics.gauge("db_pool_idle", "Idle connections", pool.get("idle", 0)),
+        metrics.gauge("db_pool_overflow", "Connections over the pool size", pool.get("overflow", 0)),
+        metrics.counter(
+            "db_pool_wait_seconds_total", "Total time spent waiting for a connection", pool.get("wait_seconds", 0)
+        ),
+        metrics.counter("product_cache_hits_total", "Product cache hits", cache["hits"]),
+        metrics.counter("product_cache_misses_total", "Product cache misses", cache["misses"]),
+        metrics.gauge("process_max_resident_memory_bytes", "Peak resident memory of the worker", memory.max_resident_bytes()),
+    )
+    return text, status.HTTP_200_OK, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+######################################################################
+# REQUEST PROFILES
+######################################################################
+@app.route("/profiles/<request_id>")
+def get_profile(request_id):
+    """Returns the profile of a request sent with X-Profile: 1"""
+    profile = profiling.profiles.get(request_id)
+    if not app.config["PROFILING_ENABLED"] or not profile:
+        abort(status.HTTP_404_NOT_FOUND, f"Profile '{request_id}' was not found.")
+    return jsonify(profile), status.HTTP_200_OK
+
+
+######################################################################
+# CACHE STATISTICS
+######################################################################
+@app.route("/stats/cache")
+def cache_stats():
+    """Returns the hit and miss counters of the product cache"""
+    return jsonify(Product.cache.stats()), status.HTTP_200_OK
+
+
+######################################################################
+# CONNECTION POOL STATISTICS
+######################################################################
+@app.route("/stats/pool")
+def connection_pool_stats():
+    """Returns the usage of the database connection pools"""
+    stats = pool_stats(db.engine.pool)
+    if REPLICA_BIND in db.engines:
+        stats[REPLICA_BIND] = pool_stats(db.engines[REPLICA_BIND].pool)
+    return jsonify(stats), status.HTTP_200_OK
+
+
 ######################################################################
 # ADD A NEW PRODUCT
 ######################################################################
@@ -46,12 +127,113 @@ def create_products():
     product.deserialize(request.get_json())
     product.create()
     message = product.serialize()
+    leaderboard.record(message)
     location_url = url_for("get_products", product_id=product.id, _external=True)
 
     app.logger.info("Product with ID [%s] created.", product.id)
     return jsonify(message), status.HTTP_201_CREATED, {"Location": location_url}
 
 
+######################################################################
+# ADD A BATCH OF PRODUCTS
+######################################################################
+@app.route("/products:batch", methods=["POST"])
+def create_products_batch():
+    """
+    Creates a batch of Products
+    This endpoint takes a JSON array or NDJSON body of Products and inserts
+    them with multi-row INSERTs, one transaction per chunk
+    """
+    app.logger.info("Request to create a batch of products")
+    check_content_type("application/json", "application/x-ndjson")
+    items = get_batch_items()
+    chunk_size = get_chunk_size() or len(items) or 1
+
+    results = []
+    products = []
+    for index, data in enumerate(items):
+        try:
+            products.append((index, Product().deserialize(data)))
+        except DataValidationError as error:
+            results.append({"index": index, "error": str(error)})
+
+    for start in range(0, len(products), chunk_size):
+        results.extend(create_chunk(products[start:start + chunk_size]))
+
+    leaderboard.clear()
+    results.sort(key=lambda result: result["index"])
+    created = sum(1 for result in results if "id" in result)
+    app.logger.info("Created %d of %d products", created, len(items))
+    message = {"created": created, "failed": len(items) - created, "results": results}
+    code = status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+    return jsonify(message), code
+
+
+def create_chunk(chunk: list) -> list:
+    """
+    Inserts a chunk of (index, Product) pairs in one transaction and
+    returns the result of every item. A chunk the database refuses is split
+    in halves that are retried, so only the Products that cannot be stored
+    are reported as failed.
+    """
+    try:
+        ids = Product.bulk_create([product for _, product in chunk])
+    except SQLAlchemyError as error:
+        if len(chunk) == 1:
+            app.logger.error("Could not create batch item %d: %s", chunk[0][0], error)
+            return [{"index": chunk[0][0], "error": "Product could not be stored"}]
+        middle = len(chunk) // 2
+        return create_chunk(chunk[:middle]) + create_chunk(chunk[middle:])
+    return [{"index": index, "id": product_id} for (index, _), product_id in zip(chunk, ids)]
+
+
+######################################################################
+# UPDATE A BATCH OF PRODUCTS
+######################################################################
+@app.route("/products:batch", methods=["PUT", "PATCH"])
+def update_products_batch():
+    """
+    Updates a batch of Products
+    This endpoint sets the same values on every Product selected by a list
+    of ids and/or a filter with a single UPDATE statement
+    """
+    app.logger.info("Request to update a batch of products")
+    check_content_type("application/json")
+    data = request.get_json()
+    if not isinstance(data, dict):
+        abort(status.HTTP_400_BAD_REQUEST, "Body must be a JSON object.")
+    criteria = get_batch_criteria(data)
+    values = Product.parse_values(data.get("set"))
+    count = Product.bulk_update(criteria, values)
+    leaderboard.clear()
+
+    app.logger.info("Updated %d products", count)
+    return jsonify(count=count), status.HTTP_200_OK
+
+
+######################################################################
+# DELETE A BATCH OF PRODUCTS
+######################################################################
+@app.route("/products:batch", methods=["DELETE"])
+def delete_products_batch():
+    """
+    Deletes a batch of Products
+    This endpoint deletes every Product selected by a list of ids and/or a
+    filter with a single DELETE statement
+    """
+    app.logger.info("Request to delete a batch of products")
+    check_content_type("application/json")
+    data = request.get_json()
+    if not isinstance(data, dict):
+        abort(status.HTTP_400_BAD_REQUEST, "Body must be a JSON object.")
+    criteria = get_batch_criteria(data)
+    count = Product.bulk_delete(criteria)
+    leaderboard.clear()
+
+    app.logger.info("Deleted %d products", count)
+    return jsonify(count=count), status.HTTP_200_OK
+
+
 ######################################################################
 # READ A PRODUCT
 ######################################################################
@@ -62,15 +244,29 @@ def get_products(product_id):
     This endpoint will return a Product based on its id
     """
     app.logger.info("Request for product with id: %s", product_id)
-    product = Product.find(product_id)
-    if not product:
+    fields = get_fields()
+    etag, message, updated_at = Product.find_cached(product_id, fields)
+    return product_response(product_id, fields, etag, message, updated_at)
+
+
+def product_response(product_id: int, fields: tuple, etag: str, message: dict, updated_at: str):
+    """
+    Returns a Product found by Product.find_cached(), or 404 Not Found
+    when the message is None.
+    """
+    if message is None:
         abort(
             status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found."
         )
-    message = product.serialize()
+    if fields:
+        # each set of fields is a different representation of the product
+        etag = f"{etag};{','.join(fields)}"
 
-    app.logger.info("Returning product: %s", product.name)
-    return jsonify(message), status.HTTP_200_OK
+    app.logger.info("Returning product: %s", product_id)
+    response = conditional_response(etag, lambda: message)
+    # the same validator for every set of fields, see Product.find_cached()
+    response.last_modified = datetime.fromisoformat(updated_at).replace(tzinfo=timezone.utc)
+    return response
 
 
 ######################################################################
@@ -87,6 +283,7 @@ def delete_products(product_id):
 
     if product:
         product.delete()
+        leaderboard.discard(product_id)
 
     return jsonify(message="success"), status.HTTP_204_NO_CONTENT
 
@@ -119,19 +316,163 @@ def list_products():
     This endpoint will list all related products filtered by the query.
     """
     app.logger.info("Request for product list")
-    products = []
+    fields = get_fields() or SERIALIZED_FIELDS
+    sort = Product.parse_sort(request.args.get("sort", ""))
+    names = tuple(name for name, _ in sort)
+    query = Product.rows(Product.find_by_filters(request.args), fields, names)
 
-    name = request.args.get("name")
+    if wants_stream():
+        return list_products_stream(query, fields, sort)
 
-    if name:
-        name_products = Product.find_by_name(name)
-    else:
-        name_products = Product.all()
+    if "limit" in request.args or "cursor" in request.args:
+        return list_products_page(query, fields, sort)
+
+    return list_products_all(query, fields, sort)
 
-    products = list(name_products)
-    results = [product.serialize() for product in products]
-    app.logger.info("Returning %d products", len(results))
-    return jsonify(results), status.HTTP_200_OK
+
+def list_products_all(query, fields: tuple, sort: tuple):
+    """
+    Returns every product matching the query within the response budget.
+    At most MAX_RESPONSE_ROWS rows are read into memory and the response
+    may hold at most MAX_RESPONSE_BYTES, larger lists are handed to
+    over_budget().
+    """
+    rows = budget_query(query, sort).all()
+    response, reason = list_response(rows, fields)
+    if reason:
+        return over_budget(query, fields, sort, reason)
+    return response
+
+
+def budget_query(query, sort: tuple):
+    """
+    Returns a Product.rows() query or select() statement in sort order,
+    limited to one row more than MAX_RESPONSE_ROWS.
+    """
+    max_rows = app.config["MAX_RESPONSE_ROWS"]
+    if sort:
+        query = query.order_by(*Product.sort_clauses(sort))
+    return query.limit(max_rows + 1) if max_rows else query
+
+
+def list_response(rows: list, fields: tuple) -> tuple:
+    """
+    Returns the response of the rows read by budget_query(), or None and
+    the reason the list is over the response budget.
+    """
+    max_rows = app.config["MAX_RESPONSE_ROWS"]
+    max_bytes = app.config["MAX_RESPONSE_BYTES"]
+    if max_rows and len(rows) > max_rows:
+        return None, f"more than {max_rows} products"
+
+    app.logger.info("Returning %d products", len(rows))
+    response = conditional_response(
+        list_etag(rows), lambda: [Product.serialize_row(row, fields) for row in rows]
+    )
+    if max_bytes and (response.content_length or 0) > max_bytes:
+        return None, f"more than {max_bytes} bytes"
+    return response, None
+
+
+def over_budget(query, fields: tuple, sort: tuple, reason: str):
+    """
+    Streams a product list that is over the response budget as a JSON
+    array, or refuses it with 413 and a link to the first page when
+    OVER_BUDGET is "reject".
+    """
+    refuse_over_budget(reason)
+    app.logger.warning("Product list has %s, streaming it", reason)
+    return list_products_array(query, fields, sort)
+
+
+def refuse_over_budget(reason: str):
+    """Refuses a list over the response budget with 413 when OVER_BUDGET is reject"""
+    if app.config["OVER_BUDGET"] == "reject":
+        args = request.args.to_dict()
+        args.update(limit=app.config["DEFAULT_PAGE_SIZE"])
+        first_page = url_for("list_products", _external=True, **args)
+        abort(
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            f"The product list has {reason}, request it in pages with limit "
+            f"and cursor starting at {first_page} or stream it with stream=true.",
+        )
+
+
+def list_products_array(query, fields: tuple, sort: tuple):
+    """
+    Streams products as a JSON array.
+    The response has the same body as an unpaged list but rows are read
+    through a server-side cursor, so memory use does not grow with it.
+    """
+    batch_size = app.config["STREAM_BATCH_SIZE"]
+
+    def generate():
+        separator = "["
+        for row in Product.stream(query, batch_size, sort):
+            yield separator + app.json.dumps(Product.serialize_row(row, fields))
+            separator = ","
+        yield "[]" if separator == "[" else "]"
+
+    return Response(
+        stream_with_context(generate()),
+        status=status.HTTP_200_OK,
+        mimetype="application/json",
+    )
+
+
+def list_products_stream(query, fields: tuple, sort: tuple):
+    """
+    Streams products as newline delimited JSON.
+    Rows are read through a server-side cursor and written out as they
+    arrive, so the first bytes go out before the whole table has been read.
+    """
+    batch_size = app.config["STREAM_BATCH_SIZE"]
+
+    def generate():
+        count = 0
+        for row in Product.stream(query, batch_size, sort):
+            count += 1
+            yield app.json.dumps(Product.serialize_row(row, fields)) + "\n"
+        app.logger.info("Streamed %d products", count)
+
+    app.logger.info("Streaming product list")
+    return Response(
+        stream_with_context(generate()),
+        status=status.HTTP_200_OK,
+        mimetype="application/x-ndjson",
+    )
+
+
+def list_products_page(query, fields: tuple, sort: tuple):
+    """
+    Returns one page of products using keyset pagination.
+    The next page is advertised with an opaque cursor in the X-Next-Cursor
+    and Link headers. The cursor holds the sort values and id of the last
+    product of the page.
+    """
+    limit = get_page_limit()
+    rows = Product.find_page(query, limit, get_page_position(sort), sort)
+    return page_response(rows, limit, fields, sort)
+
+
+def page_response(rows: list, limit: int, fields: tuple, sort: tuple):
+    """Returns a page read by Product.find_page() with the link to the next one"""
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(page_position(rows[-1], sort))
+        args = request.args.to_dict()
+        args.update(cursor=next_cursor, limit=limit)
+        next_url = url_for("list_products", _external=True, **args)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{next_url}>; rel="next"'
+
+    app.logger.info("Returning page of %d products", len(rows))
+    response = conditional_response(
+        list_etag(rows), lambda: [Product.serialize_row(row, fields) for row in rows]
+    )
+    response.headers.extend(headers)
+    return response
 
 
 ######################################################################
@@ -146,19 +487,33 @@ def update_products(product_id):
     app.logger.info("Request to update product with id: %s", product_id)
     check_content_type("application/json")
 
-    product = Product.find(product_id)
-    if not product:
+    data = request.get_json()
+    for _ in range(UPDATE_ATTEMPTS):
+        product = Product.find(product_id)
+        if not product:
+            abort(
+                status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found."
+            )
+        check_if_match(product_id, product.etag)
+        product.deserialize(data)
+        product.id = product_id
+        try:
+            product.update()
+            break
+        except StaleDataError:
+            # another write landed since the read: that fails any If-Match
+            # but "*", without a precondition the update is tried again
+            check_if_match(product_id, None)
+    else:
         abort(
-            status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found."
+            status.HTTP_409_CONFLICT,
+            f"Product with id '{product_id}' is being modified, try again.",
         )
-
-    product.deserialize(request.get_json())
-    product.id = product_id
-    product.update()
     message = product.serialize()
+    leaderboard.record(message)
 
     app.logger.info("Product with id [%s] updated.", product.id)
-    return jsonify(message), status.HTTP_200_OK
+    return jsonify(message), status.HTTP_200_OK, {"ETag": f'"{product.etag}"'}
 
 
 ######################################################################
@@ -173,38 +528,352 @@ def like_products(product_id):
     app.logger.info("Request to like product with id: %s", product_id)
     check_content_type("application/json")
 
-    product = Product.find(product_id)
-    if not product:
+    if app.config["LIKE_WRITE_BEHIND"]:
+        _, message, _ = Product.find_cached(product_id)
+        if message:
+            message["like"] += like_buffer.add(product_id)
+    else:
+        product = Product.increment_like(product_id)
+        message = product.serialize() if product else None
+
+    if not message:
         abort(
             status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found."
         )
 
-    product.like += 1
-    product.id = product_id
-    product.update()
-    message = product.serialize()
+    leaderboard.record(message)
+    app.logger.info("Product with id [%s] liked.", product_id)
+    return jsonify(message), status.HTTP_200_OK
+
+
+######################################################################
+# SEARCH PRODUCTS
+######################################################################
+@app.route("/products/search", methods=["GET"])
+def search_products():
+    """
+    Searches Products by name
+    This endpoint returns the best matches of the q query parameter for
+    typeahead, every word of q must be the prefix of a word of the name
+    """
+    terms = request.args.get("q", "")
+    app.logger.info("Request to search products for: %s", terms)
+    if not terms.strip():
+        abort(status.HTTP_400_BAD_REQUEST, "The q query parameter is required.")
+    limit = get_page_limit(app.config["SEARCH_LIMIT"], app.config["MAX_SEARCH_LIMIT"])
+    message = Product.search(terms, limit)
+    app.logger.info("Returning %d products", len(message))
+    return jsonify(message), status.HTTP_200_OK
+
+
+######################################################################
+# FACET COUNTS
+######################################################################
+@app.route("/products/facets", methods=["GET"])
+def get_facets():
+    """
+    Counts Products by category, color, size and availability
+    This endpoint takes the same filters as list_products and caches the
+    counts of each set of filters for FACETS_CACHE_TTL seconds
+    """
+    app.logger.info("Request for product facets")
+    key = tuple(sorted((param, value) for param, value in request.args.items() if param in FILTERS))
+    message = facets_cache.get(key)
+    if message is None:
+        message = Product.facets(dict(key))
+        facets_cache.set(key, message)
+    return jsonify(message), status.HTTP_200_OK
+
+
+######################################################################
+# MOST LIKED PRODUCTS
+######################################################################
+@app.route("/products/leaderboard", methods=["GET"])
+def get_leaderboard():
+    """
+    Returns the most liked Products of every Category
+    This endpoint is served from memory, the category and limit query
+    parameters select the categories and the number of Products in each
+    """
+    app.logger.info("Request for the leaderboard")
+    size = app.config["LEADERBOARD_SIZE"]
+    limit = get_page_limit(size, size)
 
-    app.logger.info("Product with id [%s] liked.", product.id)
+    categories = [category.name for category in Category]
+    if "category" in request.args:
+        if request.args["category"] not in categories:
+            abort(status.HTTP_400_BAD_REQUEST, f"Invalid category '{request.args['category']}'.")
+        categories = [request.args["category"]]
+
+    message = {category: leaderboard.top(category, limit) for category in categories}
     return jsonify(message), status.HTTP_200_OK
 
 
+######################################################################
+# CHANGE FEED
+######################################################################
+@app.route("/products/changes", methods=["GET"])
+def get_changes():
+    """
+    Returns the changes to Products after a sequence number
+    Without since only the number of the last change is returned, to start
+    following from. With wait the request waits up to that many seconds
+    for a change when there is none yet (long poll). MAX_CHANGES_WAIT is 0
+    unless the workers are threaded or async, as a sync worker can serve
+    nothing else while it waits.
+    """
+    app.logger.info("Request for product changes")
+    if "since" not in request.args:
+        return jsonify(changes=[], next=ProductChange.last_seq()), status.HTTP_200_OK
+    since = get_number("since", int, 0)
+    wait = get_number("wait", float, 0, app.config["MAX_CHANGES_WAIT"])
+    limit = get_page_limit(app.config["CHANGES_LIMIT"], app.config["CHANGES_LIMIT"])
+    settle = app.config["CHANGES_SETTLE_SECONDS"]
+
+    deadline = time.monotonic() + wait
+    changes = ProductChange.find_since(since, limit, settle)
+    while not changes and time.monotonic() < deadline:
+        # end the read transaction so the next check sees new commits
+        db.session.rollback()
+        time.sleep(min(app.config["CHANGES_POLL_INTERVAL"], max(deadline - time.monotonic(), 0)))
+        changes = ProductChange.find_since(since, limit, settle)
+
+    ids = changed_ids(changes)
+    rows = Product.rows(Product.query.filter(Product.id.in_(ids))).all() if ids else []
+    return changes_response(changes, rows, since)
+
+
+def changed_ids(changes: list) -> set:
+    """Returns the ids of the products that still exist after the changes"""
+    return {change.product_id for change in changes if change.op != "delete"}
+
+
+def changes_response(changes: list, rows: list, since: int):
+    """Returns the changes with the Product.rows() of their products"""
+    products = {row.id: Product.serialize_row(row) for row in rows}
+    message = [dict(change.serialize(), product=products.get(change.product_id)) for change in changes]
+    app.logger.info("Returning %d changes", len(message))
+    next_seq = changes[-1].seq if changes else since
+    return jsonify(changes=message, next=next_seq), status.HTTP_200_OK
+
+
 ######################################################################
 #  U T I L I T Y   F U N C T I O N S
 ######################################################################
-def check_content_type(content_type):
-    """Checks that the media type is correct"""
+def check_content_type(*content_types):
+    """Checks that the media type is one of the accepted ones"""
+    expected = " or ".join(content_types)
     if "Content-Type" not in request.headers:
         app.logger.error("No Content-Type specified.")
         abort(
             status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-            f"Content-Type must be {content_type}",
+            f"Content-Type must be {expected}",
         )
 
-    if request.headers["Content-Type"] == content_type:
+    if request.headers["Content-Type"] in content_types:
         return
 
     app.logger.error("Invalid Content-Type: %s", request.headers["Content-Type"])
     abort(
         status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-        f"Content-Type must be {content_type}",
+        f"Content-Type must be {expected}",
     )
+
+
+def check_if_match(product_id: int, etag: str):
+    """Aborts with 412 when the If-Match header does not hold the entity tag"""
+    if request.if_match and not request.if_match.contains(etag):
+        abort(
+            status.HTTP_412_PRECONDITION_FAILED,
+            f"Product with id '{product_id}' has been modified.",
+        )
+
+
+def get_batch_items():
+    """Returns the items of a JSON array or NDJSON request body"""
+    if request.headers["Content-Type"] == "application/x-ndjson":
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    items.append(None)  # reported as an invalid item
+    else:
+        items = request.get_json()
+        if not isinstance(items, list):
+            abort(status.HTTP_400_BAD_REQUEST, "Body must be a JSON array.")
+
+    if len(items) > app.config["MAX_BATCH_SIZE"]:
+        abort(
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            f"A batch holds at most {app.config['MAX_BATCH_SIZE']} products.",
+        )
+    return items
+
+
+def get_batch_criteria(data: dict) -> list:
+    """Returns the criteria selecting the products of a batch request"""
+    ids = data.get("ids")
+    filters = data.get("filter")
+    if ids is None and filters is None:
+        abort(status.HTTP_400_BAD_REQUEST, "A batch needs ids or a filter.")
+
+    criteria = []
+    if ids is not None:
+        if not isinstance(ids, list) or not all(
+            isinstance(product_id, int) and not isinstance(product_id, bool)
+            for product_id in ids
+        ):
+            abort(status.HTTP_400_BAD_REQUEST, "ids must be a list of integers.")
+        criteria.append(Product.id.in_(ids))
+    if filters is not None:
+        if not isinstance(filters, dict) or not filters:
+            abort(status.HTTP_400_BAD_REQUEST, "filter must be a JSON object.")
+        unknown = set(filters) - set(FILTERS)
+        if unknown:
+            # an ignored filter would turn the batch into a whole table update
+            abort(status.HTTP_400_BAD_REQUEST, f"Unknown filters {sorted(unknown)}.")
+        # filters use the same syntax as the GET /products query string
+        filters = {
+            key: value if isinstance(value, str) else json.dumps(value)
+            for key, value in filters.items()
+        }
+        criteria.extend(Product.filter_criteria(filters))
+    return criteria
+
+
+def get_chunk_size():
+    """Returns the number of products inserted per transaction, 0 for all"""
+    chunk_size = request.args.get("chunk_size", app.config["BATCH_CHUNK_SIZE"])
+    try:
+        chunk_size = int(chunk_size)
+    except ValueError:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid chunk_size '{chunk_size}'.")
+    if chunk_size < 0:
+        abort(status.HTTP_400_BAD_REQUEST, "chunk_size must not be negative.")
+    return chunk_size
+
+
+def conditional_response(etag: str, build_message):
+    """
+    Returns 304 Not Modified when If-None-Match holds the entity tag, and
+    otherwise the JSON message returned by build_message()
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = jsonify(build_message())
+    response.set_etag(etag)
+    return response
+
+
+def list_etag(products: list) -> str:
+    """Returns the entity tag of a list of products or Product.rows()"""
+    digest = hashlib.sha1(request.query_string, usedforsecurity=False)
+    for product in products:
+        digest.update(f"{product.id}-{product.version},".encode("ascii"))
+    return digest.hexdigest()
+
+
+def wants_stream(incoming=None):
+    """Checks if a request, the current one by default, asked for a streamed NDJSON response"""
+    incoming = incoming or request
+    if incoming.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return True
+    best = incoming.accept_mimetypes.best_match(
+        ["application/json", "application/x-ndjson"]
+    )
+    return best == "application/x-ndjson"
+
+
+def get_fields():
+    """Returns the fields requested with the fields query parameter or None"""
+    if "fields" not in request.args:
+        return None
+    names = (name.strip() for name in request.args["fields"].split(","))
+    fields = tuple(dict.fromkeys(name for name in names if name))
+    unknown = [name for name in fields if name not in SERIALIZED_FIELDS]
+    if not fields or unknown:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            f"Invalid fields '{request.args['fields']}', "
+            f"choose from {', '.join(SERIALIZED_FIELDS)}.",
+        )
+    return fields
+
+
+def get_number(name: str, kind, minimum, maximum=None):
+    """Returns a numeric query parameter, minimum when it is not given"""
+    value = request.args.get(name, minimum)
+    try:
+        value = kind(value)
+    except ValueError:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid {name} '{value}'.")
+    if value < minimum or (maximum is not None and value > maximum):
+        bounds = f"between {minimum} and {maximum}" if maximum is not None else f"at least {minimum}"
+        abort(status.HTTP_400_BAD_REQUEST, f"{name} must be {bounds}.")
+    return value
+
+
+def get_page_limit(default: int = None, maximum: int = None):
+    """Returns the page size requested with the limit query parameter"""
+    default = default or app.config["DEFAULT_PAGE_SIZE"]
+    maximum = maximum or app.config["MAX_PAGE_SIZE"]
+    limit = request.args.get("limit", default)
+    try:
+        limit = int(limit)
+    except ValueError:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid limit '{limit}'.")
+    if not 1 <= limit <= maximum:
+        abort(status.HTTP_400_BAD_REQUEST, f"limit must be between 1 and {maximum}.")
+    return limit
+
+
+def page_position(row, sort: tuple) -> dict:
+    """Returns the position of a row of Product.rows() in a sort order"""
+    position = {"id": row.id}
+    if sort:
+        position["sort"] = sort_key(sort)
+        position["values"] = [getattr(row, name) for name, _ in sort]
+    return position
+
+
+def get_page_position(sort: tuple):
+    """Returns the sort values and id of the cursor query parameter or None"""
+    cursor = request.args.get("cursor")
+    if not cursor:
+        return None
+    position = decode_cursor(cursor)
+    values = position.get("values", [])
+    if (
+        not isinstance(position.get("id"), int)
+        or position.get("sort", "") != sort_key(sort)
+        or not isinstance(values, list)
+        or len(values) != len(sort)
+    ):
+        abort(status.HTTP_400_BAD_REQUEST, "Invalid cursor.")
+    return values, position["id"]
+
+
+def sort_key(sort: tuple) -> str:
+    """Returns the canonical text of a sort order"""
+    return ",".join(("-" if descending else "") + name for name, descending in sort)
+
+
+def encode_cursor(position: dict) -> str:
+    """Encodes a page position into an opaque cursor"""
+    data = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Decodes an opaque cursor back into a page position"""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        abort(status.HTTP_400_BAD_REQUEST, "Invalid cursor.")
+    if not isinstance(position, dict):
+        abort(status.HTTP_400_BAD_REQUEST, "Invalid cursor.")
+    return position
@@ -0,0 +1,46 @@
+"""
+Test cases for the benchmark helpers
+"""
+from unittest import TestCase
+from benchmarks.compare import compare
+from benchmarks.rest_api import parse_mix, percentile, summarize
+
+
+######################################################################
+#  B E N C H M A R K   T E S T   C A S E S
+######################################################################
+class TestBenchmarks(TestCase):
+    """Test Cases for the benchmark helpers"""
+
+    def test_percentile(self):
+        """It should return nearest rank percentiles"""
+        timings = list(range(1, 101))
+        self.assertEqual(percentile(timings, 50), 50)
+        self.assertEqual(percentile(timings, 95), 95)
+        self.assertEqual(percentile(timings, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_summarize(self):
+        """It should summarize the samples per endpoint"""
+        samples = [("GET /products", 200, 2.0), ("GET /products", 500, 4.0), ("PUT /x", 200, 1.0)]
+        results = summarize(samples, 2.0)
+        self.assertEqual(list(results), ["GET /products", "PUT /x"])
+        self.assertEqual(results["GET /products"]["requests"], 2)
+        self.assertEqual(results["GET /products"]["errors"], 1)
+        self.assertEqual(results["GET /products"]["rps"], 1.0)
+        self.assertEqual(results["GET /products"]["p99_ms"], 4.0)
+
+    def test_parse_mix(self):
+        """It should parse a workload mix"""
+        self.assertEqual(parse_mix("read=80, like=20"), {"read": 80.0, "like": 20.0})
+        self.assertRaises(ValueError, parse_mix, "scan=1")
+
+    def test_compare(self):
+        """It should flag slower latencies and lower throughput"""
+        stats = {"p50_ms": 1.0, "p95_ms": 2.0, "p99_ms": 4.0, "rps": 100.0}
+        baseline = {"endpoints": {"GET /products": stats, "GET /old": stats}}
+        results = {"endpoints": {"GET /products": dict(stats, p99_ms=5.0, rps=95.0), "GET /new": stats}}
+        rows = compare(baseline, results, threshold=10)
+        self.assertEqual([row[1] for row in rows if row[-1]], ["p99_ms"])
+        self.assertEqual({row[0] for row in rows}, {"GET /products"})
@@ -0,0 +1,90 @@
+"""
+Test cases for the Cache backends
+"""
+import time
+from unittest import TestCase
+from service.common.cache import CacheBackend, LRUCache, NullCache, create_cache
+
+
+class IncompleteCache(CacheBackend):
+    """A backend that forgot to implement delete() and clear()"""
+
+    def _get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+
+######################################################################
+#  C A C H E   T E S T   C A S E S
+######################################################################
+class TestLRUCache(TestCase):
+    """Test Cases for LRUCache"""
+
+    def setUp(self):
+        """This runs before each test"""
+        self.cache = LRUCache({"CACHE_SIZE": 2, "CACHE_TTL": 60})
+
+    def test_get_and_set(self):
+        """It should return cached values and count hits and misses"""
+        self.assertIsNone(self.cache.get(1))
+        self.cache.set(1, {"name": "pot"})
+        self.assertEqual(self.cache.get(1), {"name": "pot"})
+        stats = self.cache.stats()
+        self.assertEqual(stats["backend"], "memory")
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_ratio"], 0.5)
+        self.assertEqual(stats["size"], 1)
+
+    def test_evict_least_recently_used(self):
+        """It should evict the least recently used key when full"""
+        self.cache.set(1, "one")
+        self.cache.set(2, "two")
+        self.cache.get(1)
+        self.cache.set(3, "three")
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get(2))
+        self.assertEqual(self.cache.get(1), "one")
+        self.assertEqual(self.cache.get(3), "three")
+
+    def test_expire(self):
+        """It should not return expired values"""
+        self.cache.ttl = 0.01
+        self.cache.set(1, "one")
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_delete_and_clear(self):
+        """It should remove keys"""
+        self.cache.set(1, "one")
+        self.cache.set(2, "two")
+        self.cache.delete(1)
+        self.cache.delete(42)
+        self.assertIsNone(self.cache.get(1))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get(2))
+
+
+class TestCreateCache(TestCase):
+    """Test Cases for create_cache"""
+
+    def test_create_named_backend(self):
+        """It should create the backends by name"""
+        self.assertIsInstance(create_cache({"CACHE_BACKEND": "memory"}), LRUCache)
+        cache = create_cache({"CACHE_BACKEND": "none"})
+        self.assertIsInstance(cache, NullCache)
+        cache.set(1, "one")
+        self.assertIsNone(cache.get(1))
+
+    def test_create_imported_backend(self):
+        """It should import backends given as module:ClassName"""
+        cache = create_cache({"CACHE_BACKEND": "service.common.cache:NullCache"})
+        self.assertIsInstance(cache, NullCache)
+
+    def test_create_incomplete_backend(self):
+        """It should not create a backend missing a method of the interface"""
+        with self.assertRaises(TypeError):
+            create_cache({"CACHE_BACKEND": "tests.test_cache:IncompleteCache"})
@@ -2,10 +2,13 @@
 CLI Command Extensions for Flask
 """
 import os
+from datetime import datetime, timezone
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
-from service.common.cli_commands import db_create
+from sqlalchemy.dialects import postgresql, sqlite
+from service.common.cli_commands import DB_INIT_LOCK, changes_prune, db_create, db_init, db_upgrade
+from service.models import Product
 
 
 class TestFlaskCLI(TestCase):
@@ -21,3 +24,97 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    @patch("service.common.cli_commands.db")
+    def test_db_init(self, db_mock):
+        """It should create the missing tables without dropping any"""
+        conn = db_mock.engine.begin.return_value.__enter__.return_value
+        conn.dialect = sqlite.dialect()
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_init)
+            self.assertEqual(result.exit_code, 0)
+        db_mock.metadata.create_all.assert_called_once_with(conn)
+        db_mock.drop_all.assert_not_called()
+        conn.execute.assert_not_called()
+
+    @patch("service.common.cli_commands.db")
+    def test_db_init_lock(self, db_mock):
+        """It should serialize concurrent db-init runs on PostgreSQL"""
+        conn = db_mock.engine.begin.return_value.__enter__.return_value
+        conn.dialect = postgresql.dialect()
+        conn.execute.side_effect = lambda *args: db_mock.metadata.create_all.assert_not_called()
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_init)
+            self.assertEqual(result.exit_code, 0)
+        statement, params = conn.execute.call_args.args
+        self.assertEqual(str(statement), "SELECT pg_advisory_xact_lock(:key)")
+        self.assertEqual(params, {"key": DB_INIT_LOCK})
+        db_mock.metadata.create_all.assert_called_once_with(conn)
+
+    @patch("service.common.cli_commands.ProductChange")
+    def test_changes_prune(self, change_mock):
+        """It should delete the changes older than the retention"""
+        change_mock.prune.return_value = 3
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(changes_prune, ["--days", "2"])
+            self.assertEqual(result.exit_code, 0)
+        before = change_mock.prune.call_args.args[0]
+        age = datetime.now(timezone.utc).replace(tzinfo=None) - before
+        self.assertAlmostEqual(age.total_seconds(), 2 * 86400, delta=60)
+
+    @patch("service.common.cli_commands.db")
+    def test_db_upgrade(self, db_mock):
+        """It should create the indexes concurrently with db-upgrade"""
+        db_mock.engine.dialect.name = "postgresql"
+        db_mock.engine.dialect.identifier_preparer.quote = lambda name: f'"{name}"'
+        conn = db_mock.engine.connect.return_value.execution_options.return_value
+        conn = conn.__enter__.return_value
+        conn.execute.return_value.scalars.return_value = ["ix_product_name"]
+        conn.dialect = postgresql.dialect()
+        columns = [{"name": c.name} for c in Product.__table__.columns if c.name != "version"]
+        db_mock.inspect.return_value.get_columns.return_value = columns
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_upgrade)
+            self.assertEqual(result.exit_code, 0)
+        statements = [str(call.args[0]) for call in conn.execute.call_args_list]
+        self.assertIn('DROP INDEX CONCURRENTLY IF EXISTS "ix_product_name"', statements)
+        self.assertEqual(
+            ["ALTER TABLE product ADD COLUMN version INTEGER DEFAULT '1' NOT NULL"],
+            [statement for statement in statements if "ALTER" in statement],
+        )
+        self.assertIn("CREATE EXTENSION IF NOT EXISTS pg_trgm", statements)
+        self.assertIn(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_product_category_available "
+            "ON product (category, available)",
+            statements,
+        )
+        self.assertIn(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_product_name_trgm "
+            "ON product USING gin (lower(name) gin_trgm_ops)",
+            statements,
+        )
+
+    @patch("service.common.cli_commands.db")
+    def test_db_upgrade_sqlite(self, db_mock):
+        """It should only create the indexes of the database with db-upgrade"""
+        db_mock.engine.dialect.name = "sqlite"
+        conn = db_mock.engine.connect.return_value.execution_options.return_value
+        conn = conn.__enter__.return_value
+        conn.dialect = sqlite.dialect()
+        columns = [{"name": c.name} for c in Product.__table__.columns if c.name != "updated_at"]
+        db_mock.inspect.return_value.get_columns.return_value = columns
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_upgrade)
+            self.assertEqual(result.exit_code, 0)
+        statements = [str(call.args[0]) for call in conn.execute.call_args_list]
+        # SQLite only adds NOT NULL columns with a constant default
+        self.assertIn(
+            "ALTER TABLE product ADD COLUMN updated_at DATETIME "
+            "DEFAULT '1970-01-01 00:00:00.000000' NOT NULL",
+            statements,
+        )
+        self.assertIn("CREATE INDEX IF NOT EXISTS ix_product_name ON product (name)", statements)
+        self.assertIn(
+            "CREATE INDEX IF NOT EXISTS ix_product_updated_at ON product (updated_at, id)", statements
+        )
+        self.assertFalse([statement for statement in statements if "gin" in statement])
@@ -0,0 +1,103 @@
+"""
+Test cases for the Database Pool helpers
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+from service.common.db_pool import TimedQueuePool, configure_sqlite, engine_options, pool_stats
+
+CONFIG = {
+    "DB_POOL_SIZE": 4,
+    "DB_MAX_OVERFLOW": 2,
+    "DB_POOL_RECYCLE": 600,
+    "DB_POOL_TIMEOUT": 5.0,
+    "DB_POOL_PRE_PING": True,
+    "DB_STATEMENT_TIMEOUT": 0,
+}
+
+
+######################################################################
+#  D A T A B A S E   P O O L   T E S T   C A S E S
+######################################################################
+class TestDatabasePool(TestCase):
+    """Test Cases for the connection pool helpers"""
+
+    def test_postgres_engine_options(self):
+        """It should size the pool of a PostgreSQL database"""
+        config = dict(CONFIG, SQLALCHEMY_DATABASE_URI="postgresql://u:p@db:5432/x")
+        options = engine_options(config)
+        self.assertIs(options["poolclass"], TimedQueuePool)
+        self.assertEqual(options["pool_size"], 4)
+        self.assertEqual(options["max_overflow"], 2)
+        self.assertEqual(options["pool_recycle"], 600)
+        self.assertEqual(options["pool_timeout"], 5.0)
+        self.assertTrue(options["pool_pre_ping"])
+        self.assertNotIn("connect_args", options)
+
+        config["DB_STATEMENT_TIMEOUT"] = 2500
+        options = engine_options(config)
+        self.assertEqual(
+            options["connect_args"], {"options": "-c statement_timeout=2500"}
+        )
+
+    def test_sqlite_engine_options(self):
+        """It should leave the pool of a SQLite database alone"""
+        config = dict(CONFIG, SQLALCHEMY_DATABASE_URI="sqlite://")
+        self.assertEqual(engine_options(config), {})
+
+    def test_pool_stats(self):
+        """It should report the usage and the waits of a pool"""
+        pool = TimedQueuePool(lambda: sqlite3.connect(":memory:"), pool_size=2, max_overflow=0)
+        first = pool.connect()
+        second = pool.connect()
+        stats = pool_stats(pool)
+        self.assertEqual(stats["pool"], "TimedQueuePool")
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["checked_out"], 2)
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertEqual(stats["waits"], 0)
+
+        # the pool is exhausted, the next checkout waits for a connection
+        timer = threading.Timer(0.1, first.close)
+        timer.start()
+        third = pool.connect()
+        timer.join()
+        stats = pool_stats(pool)
+        self.assertEqual(stats["checkouts"], 3)
+        self.assertEqual(stats["waits"], 1)
+        self.assertGreaterEqual(stats["wait_seconds"], 0.05)
+        self.assertEqual(stats["wait_max_seconds"], stats["wait_seconds"])
+        second.close()
+        third.close()
+        stats = pool_stats(pool)
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["idle"], 2)
+
+    def test_other_pool_stats(self):
+        """It should report the class of pools without counters"""
+        pool = StaticPool(lambda: sqlite3.connect(":memory:"))
+        self.assertEqual(pool_stats(pool), {"pool": "StaticPool"})
+
+    def test_configure_sqlite(self):
+        """It should use WAL journaling on SQLite database files"""
+        with tempfile.TemporaryDirectory() as folder:
+            engine = create_engine(f"sqlite:///{os.path.join(folder, 'products.db')}")
+            configure_sqlite(engine, {"SQLITE_JOURNAL_MODE": "wal"})
+            with engine.connect() as conn:
+                self.assertEqual(conn.execute(text("PRAGMA journal_mode")).scalar(), "wal")
+                self.assertEqual(conn.execute(text("PRAGMA foreign_keys")).scalar(), 1)
+            engine.dispose()
+
+        engine = create_engine("sqlite://")
+        configure_sqlite(engine, {})
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute(text("PRAGMA journal_mode")).scalar(), "memory")
+        self.assertRaises(ValueError, configure_sqlite, engine, {"SQLITE_JOURNAL_MODE": "WAL; DROP"})
+        postgres = MagicMock()
+        postgres.dialect.name = "postgresql"
+        configure_sqlite(postgres, {"SQLITE_JOURNAL_MODE": "nope"})
@@ -0,0 +1,56 @@
+"""
+Test cases for the JSON providers
+"""
+from datetime import date
+from decimal import Decimal
+from unittest import TestCase
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from service.common.json_provider import OrjsonProvider, create_provider
+
+
+######################################################################
+#  J S O N   P R O V I D E R   T E S T   C A S E S
+######################################################################
+class TestJsonProvider(TestCase):
+    """Test Cases for the JSON providers"""
+
+    def setUp(self):
+        """This runs before each test"""
+        self.app = Flask(__name__)
+
+    def test_create_provider(self):
+        """It should create the provider named by JSON_PROVIDER"""
+        self.assertIsInstance(create_provider(self.app), OrjsonProvider)
+        self.app.config["JSON_PROVIDER"] = "default"
+        provider = create_provider(self.app)
+        self.assertIsInstance(provider, DefaultJSONProvider)
+        self.assertNotIsInstance(provider, OrjsonProvider)
+        self.app.config["JSON_PROVIDER"] = "flask.json.provider:DefaultJSONProvider"
+        self.assertIsInstance(create_provider(self.app), DefaultJSONProvider)
+
+    def test_same_output_as_default(self):
+        """It should encode like the default provider"""
+        orjson_provider = OrjsonProvider(self.app)
+        default_provider = DefaultJSONProvider(self.app)
+        data = {"name": "pot", "like": 3, "available": True, "tags": ["a", "é"]}
+        self.assertEqual(
+            orjson_provider.loads(orjson_provider.dumps(data)),
+            default_provider.loads(default_provider.dumps(data)),
+        )
+        self.assertEqual(list(orjson_provider.loads(orjson_provider.dumps(data))), sorted(data))
+        self.assertEqual(orjson_provider.dumps({"indent": 1}, indent=2), '{\n  "indent": 1\n}')
+
+    def test_unknown_types(self):
+        """It should encode types orjson does not know with the default hook"""
+        provider = OrjsonProvider(self.app)
+        self.assertEqual(provider.dumps(date(2023, 3, 1)), '"2023-03-01"')
+        self.assertEqual(provider.dumps(Decimal("1.50")), '"1.50"')
+
+    def test_response(self):
+        """It should build a JSON response"""
+        provider = OrjsonProvider(self.app)
+        with self.app.app_context():
+            response = provider.response(name="pot")
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(response.get_json(), {"name": "pot"})
@@ -0,0 +1,81 @@
+"""
+Test cases for the Leaderboard
+"""
+from unittest import TestCase
+from unittest.mock import patch
+from service.common.leaderboard import Leaderboard
+
+
+def product(product_id: int, like: int, category: str = "GROCERIES") -> dict:
+    """Returns a serialized product"""
+    return {"id": product_id, "like": like, "category": category}
+
+
+######################################################################
+#  L E A D E R B O A R D   T E S T   C A S E S
+######################################################################
+class TestLeaderboard(TestCase):
+    """Test Cases for Leaderboard"""
+
+    def setUp(self):
+        """This runs before each test"""
+        self.products = [product(1, 5), product(2, 3), product(3, 1), product(4, 9, "BEAUTY")]
+        self.loads = []
+        self.board = Leaderboard(self.load_top, size=2, ttl=60)
+
+    def load_top(self, category: str, count: int) -> list:
+        """Loads the top products like the database would"""
+        self.loads.append(category)
+        products = [p for p in self.products if p["category"] == category]
+        return [dict(p) for p in sorted(products, key=lambda p: (-p["like"], -p["id"]))[:count]]
+
+    def test_top(self):
+        """It should load a board once and serve it from memory"""
+        self.assertEqual(self.board.top("GROCERIES", 2), [product(1, 5), product(2, 3)])
+        self.assertEqual(self.board.top("GROCERIES", 1), [product(1, 5)])
+        self.assertEqual(self.board.top("BEAUTY", 2), [product(4, 9, "BEAUTY")])
+        self.assertEqual(self.board.top("FASHION", 2), [])
+        self.assertEqual(self.loads, ["GROCERIES", "BEAUTY", "FASHION"])
+
+    def test_record_likes(self):
+        """It should move liked products up without reloading"""
+        self.board.top("GROCERIES", 2)
+        self.products[2]["like"] = 4
+        self.board.record(product(3, 4))
+        self.assertEqual(self.board.top("GROCERIES", 2), [product(1, 5), product(3, 4)])
+        self.board.record(product(3, 6))
+        self.assertEqual(self.board.top("GROCERIES", 2), [product(3, 6), product(1, 5)])
+        self.board.record(product(5, 0))
+        self.assertEqual(self.board.top("GROCERIES", 2), [product(3, 6), product(1, 5)])
+        # a board that was never read is left alone
+        self.board.record(product(6, 7, "FASHION"))
+        self.assertEqual(self.loads, ["GROCERIES"])
+
+    def test_lost_rank(self):
+        """It should reload a board when a product leaves it"""
+        self.board.top("GROCERIES", 2)
+        self.products[0]["like"] = 0
+        self.board.record(product(1, 0))
+        self.assertEqual(self.board.top("GROCERIES", 2), [product(2, 3), product(3, 1)])
+        self.board.discard(2)
+        self.products.pop(1)
+        self.assertEqual(self.board.top("GROCERIES", 2), [product(3, 1), product(1, 0)])
+        self.board.record(product(3, 1, "BEAUTY"))
+        self.products[1]["category"] = "BEAUTY"
+        self.assertEqual(self.board.top("GROCERIES", 2), [product(1, 0)])
+        self.assertEqual(self.loads, ["GROCERIES"] * 4)
+        self.board.discard(42)
+        self.board.clear()
+        self.board.top("GROCERIES", 2)
+        self.assertEqual(len(self.loads), 5)
+
+    def test_reload_after_ttl(self):
+        """It should reload a board after the ttl"""
+        with patch("service.common.leaderboard.time.monotonic", return_value=0):
+            self.board.top("GROCERIES", 2)
+        with patch("service.common.leaderboard.time.monotonic", return_value=30):
+            self.board.top("GROCERIES", 2)
+        self.assertEqual(len(self.loads), 1)
+        with patch("service.common.leaderboard.time.monotonic", return_value=61):
+            self.board.top("GROCERIES", 2)
+        self.assertEqual(len(self.loads), 2)
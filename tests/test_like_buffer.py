@@ -0,0 +1,59 @@
+"""
+Test cases for the Like Buffer
+"""
+from unittest import TestCase
+from unittest.mock import MagicMock
+from service import app
+from service.common.like_buffer import LikeBuffer
+
+
+######################################################################
+#  L I K E   B U F F E R   T E S T   C A S E S
+######################################################################
+class TestLikeBuffer(TestCase):
+    """Test Cases for LikeBuffer"""
+
+    def setUp(self):
+        """This runs before each test"""
+        self.flush_likes = MagicMock()
+        self.buffer = LikeBuffer(app, self.flush_likes, interval=60)
+
+    def tearDown(self):
+        """This runs after each test"""
+        self.buffer.stop()
+
+    def test_add_likes(self):
+        """It should aggregate likes per product"""
+        self.assertEqual(self.buffer.add(1), 1)
+        self.assertEqual(self.buffer.add(1), 2)
+        self.assertEqual(self.buffer.add(2, 5), 5)
+        self.assertEqual(self.buffer.pending(1), 2)
+        self.assertEqual(self.buffer.pending(3), 0)
+
+    def test_flush(self):
+        """It should write the aggregated likes and empty the buffer"""
+        self.assertEqual(self.buffer.flush(), 0)
+        self.flush_likes.assert_not_called()
+        self.buffer.add(1)
+        self.buffer.add(1)
+        self.buffer.add(2)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.flush_likes.assert_called_once_with({1: 2, 2: 1})
+        self.assertEqual(self.buffer.pending(1), 0)
+
+    def test_flush_error(self):
+        """It should keep the likes when a flush fails"""
+        self.flush_likes.side_effect = RuntimeError("database is down")
+        self.buffer.add(1, 3)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.buffer.add(1)
+        self.assertEqual(self.buffer.pending(1), 4)
+        self.flush_likes.side_effect = None
+        self.assertEqual(self.buffer.flush(), 1)
+        self.flush_likes.assert_called_with({1: 4})
+
+    def test_stop(self):
+        """It should flush what is left when stopped"""
+        self.buffer.add(7)
+        self.buffer.stop()
+        self.flush_likes.assert_called_once_with({7: 1})
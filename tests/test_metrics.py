@@ -0,0 +1,61 @@
+"""
+Test cases for the Prometheus metrics
+"""
+from unittest import TestCase
+from service.common import metrics
+from service.common.metrics import Counter, Histogram, format_labels, gauge
+
+
+######################################################################
+#  M E T R I C S   T E S T   C A S E S
+######################################################################
+class TestMetrics(TestCase):
+    """Test Cases for Counter and Histogram"""
+
+    def test_format_labels(self):
+        """It should format and escape label values"""
+        self.assertEqual(format_labels((), ()), "")
+        self.assertEqual(
+            format_labels(("endpoint", "status"), ('say "hi"', 200)),
+            r'{endpoint="say \"hi\"",status="200"}',
+        )
+
+    def test_counter(self):
+        """It should count per label values"""
+        counter = Counter("requests_total", "Requests", ("status",))
+        counter.inc((200,))
+        counter.inc((200,))
+        counter.inc((404,), 3)
+        self.assertEqual(
+            counter.render(),
+            [
+                "# HELP requests_total Requests",
+                "# TYPE requests_total counter",
+                'requests_total{status="200"} 2',
+                'requests_total{status="404"} 3',
+            ],
+        )
+
+    def test_histogram(self):
+        """It should count observations in cumulative buckets"""
+        histogram = Histogram("latency", "Latency", ("endpoint",), (0.1, 1.0))
+        histogram.observe(("get",), 0.05)
+        histogram.observe(("get",), 0.5)
+        histogram.observe(("get",), 5.0)
+        lines = histogram.render()
+        self.assertIn("# TYPE latency histogram", lines)
+        self.assertIn('latency_bucket{endpoint="get",le="0.1"} 1', lines)
+        self.assertIn('latency_bucket{endpoint="get",le="1.0"} 2', lines)
+        self.assertIn('latency_bucket{endpoint="get",le="+Inf"} 3', lines)
+        self.assertIn('latency_sum{endpoint="get"} 5.55', lines)
+        self.assertIn('latency_count{endpoint="get"} 3', lines)
+
+    def test_gauge(self):
+        """It should render a gauge"""
+        self.assertEqual(gauge("idle", "Idle", 4)[-1], "idle 4")
+
+    def test_counter_total(self):
+        """It should render a total read at scrape time as a counter"""
+        lines = metrics.counter("hits_total", "Hits", 7)
+        self.assertIn("# TYPE hits_total counter", lines)
+        self.assertEqual(lines[-1], "hits_total 7")
@@ -5,9 +5,15 @@ Test cases for Product Model
 import os
 import logging
 import unittest
-from datetime import date
+from unittest.mock import patch
+from datetime import date, datetime, timedelta, timezone
+from flask import Flask
 from werkzeug.exceptions import NotFound
-from service.models import Product, DataValidationError, db
+from sqlalchemy import event, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
+from service.models import Product, ProductChange, ChangesPruned, DataValidationError, db
 from service import app
 from tests.factories import ProductFactory
 
@@ -94,6 +100,68 @@ class TestProductModel(unittest.TestCase):
         products = Product.all()
         self.assertEqual(len(products), 5)
 
+    def test_parse_sort(self):
+        """It should parse a sort order"""
+        self.assertEqual(Product.parse_sort(""), ())
+        self.assertEqual(
+            Product.parse_sort("like, -create_date"), (("like", False), ("create_date", True))
+        )
+        for sort in ["price", "like,like", "--like", "-"]:
+            self.assertRaises(DataValidationError, Product.parse_sort, sort)
+        self.assertRaises(
+            DataValidationError, Product.after_criteria, (("category", False),), ["NOPE"], 1
+        )
+        for name, value in [("like", "abc"), ("like", True), ("available", 1), ("name", 42)]:
+            self.assertRaises(
+                DataValidationError, Product.after_criteria, ((name, False),), [value], 1
+            )
+
+    def test_init_db_is_lazy(self):
+        """It should not touch the database on init without DB_AUTO_CREATE"""
+        connects = []
+
+        def count(conn):
+            connects.append(conn)
+
+        # a separate app keeps the engine (and in-memory database) of this suite
+        other = Flask(__name__)
+        other.config.update(app.config, DB_AUTO_CREATE=False)
+        context = other.app_context()
+        product_app, cache = Product.app, Product.cache
+        event.listen(Engine, "engine_connect", count)
+        try:
+            with patch.object(other, "app_context", return_value=context), \
+                    patch.object(db, "create_all") as create_all:
+                Product.init_db(other)
+            create_all.assert_not_called()
+            self.assertEqual(connects, [])
+        finally:
+            event.remove(Engine, "engine_connect", count)
+            context.pop()
+            Product.app, Product.cache = product_app, cache
+
+    def test_enum_constraint(self):
+        """It should not store unknown enum values on any database"""
+        product = ProductFactory()
+        product.create()
+        # plain SQL skips the checks of the Enum type, the database must refuse it
+        statement = text("UPDATE product SET color = 'PLAID' WHERE id = :id")
+        with self.assertRaises(SQLAlchemyError):
+            db.session.execute(statement, {"id": product.id})
+            db.session.commit()
+        db.session.rollback()
+
+    def test_serialize_rows(self):
+        """It should serialize Product rows like Products"""
+        products = ProductFactory.create_batch(3)
+        Product.bulk_create(products)
+        expected = {product.id: product.serialize() for product in Product.all()}
+        rows = Product.rows(Product.query).all()
+        self.assertEqual(len(rows), 3)
+        for row in rows:
+            self.assertEqual(Product.serialize_row(row), expected[row.id])
+            self.assertEqual(f"{row.id}-{row.version}", Product.find(row.id).etag)
+
     def test_serialize_a_product(self):
         """It should serialize a Product"""
         product = ProductFactory()
@@ -162,6 +230,13 @@ class TestProductModel(unittest.TestCase):
         product = Product()
         self.assertRaises(DataValidationError, product.deserialize, data)
 
+    def test_deserialize_bad_date(self):
+        """It should not deserialize a bad date"""
+        data = ProductFactory().serialize()
+        data["create_date"] = "notadate"
+        product = Product()
+        self.assertRaises(DataValidationError, product.deserialize, data)
+
     def test_deserialize_invalid_attribute(self):
         """It should not deserialize invalid attribute"""
         data = {
@@ -287,6 +362,234 @@ class TestProductModel(unittest.TestCase):
         for product in found:
             self.assertEqual(product.last_modify_date, last_modify_date)
 
+    def test_find_by_filters(self):
+        """It should Find Products matching several filters at once"""
+        products = ProductFactory.create_batch(10)
+        for product in products:
+            product.create()
+        category = products[0].category
+        available = products[0].available
+        like_min = 3
+        count = len(
+            [
+                product
+                for product in products
+                if product.category == category
+                and product.available == available
+                and product.like >= like_min
+            ]
+        )
+        filters = {
+            "category": category.name,
+            "available": str(available).lower(),
+            "like_min": str(like_min),
+            "limit": "5",  # not a filter, should be ignored
+        }
+        found = Product.find_by_filters(filters)
+        self.assertEqual(found.count(), count)
+        for product in found:
+            self.assertEqual(product.category, category)
+            self.assertEqual(product.available, available)
+            self.assertGreaterEqual(product.like, like_min)
+
+    def test_find_by_date_range(self):
+        """It should Find Products created within a date range"""
+        products = ProductFactory.create_batch(10)
+        for product in products:
+            product.create()
+        dates = sorted(product.create_date for product in products)
+        low, high = dates[2], dates[7]
+        count = len([p for p in products if low <= p.create_date <= high])
+        found = Product.find_by_filters(
+            {"create_date_min": low.isoformat(), "create_date_max": high.isoformat()}
+        )
+        self.assertEqual(found.count(), count)
+
+    def test_find_by_bad_filters(self):
+        """It should not Find Products with invalid filter values"""
+        for filters in (
+            {"color": "PLAID"},
+            {"available": "maybe"},
+            {"like_min": "many"},
+            {"create_date_max": "yesterday"},
+        ):
+            self.assertRaises(DataValidationError, Product.find_by_filters, filters)
+
+    def test_updated_at(self):
+        """It should keep the time of the last write of a Product"""
+        product = ProductFactory(like=0)
+        product.create()
+        created = product.updated_at
+        self.assertIsNotNone(created)
+
+        product.name = "Renamed"
+        product.update()
+        updated = product.updated_at
+        self.assertGreater(updated, created)
+
+        # writes that do not go through the ORM set it too
+        liked = Product.increment_like(product.id)
+        self.assertGreater(liked.updated_at, updated)
+        Product.bulk_update([Product.id == product.id], {Product.available: True})
+        db.session.expire_all()
+        self.assertGreater(Product.find(product.id).updated_at, liked.updated_at)
+
+    def test_find_updated_since(self):
+        """It should Find the Products written since a time"""
+        products = ProductFactory.create_batch(3)
+        for product in products:
+            product.create()
+        since = products[1].updated_at
+        found = Product.find_by_filters({"updated_since": since.isoformat()})
+        self.assertEqual([p.id for p in found.order_by(Product.id)], [p.id for p in products[1:]])
+
+        # times with a zone are compared in UTC
+        aware = since.replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=2)))
+        self.assertEqual(Product.find_by_filters({"updated_since": aware.isoformat()}).count(), 2)
+        zulu = since.isoformat() + "Z"
+        self.assertEqual(Product.find_by_filters({"updated_since": zulu}).count(), 2)
+        self.assertRaises(DataValidationError, Product.find_by_filters, {"updated_since": "yesterday"})
+
+    def test_default_dates(self):
+        """It should date new Products on the day they are created"""
+        product = ProductFactory()
+        product.create_date = None
+        product.last_modify_date = None
+        product.create()
+        self.assertEqual(product.create_date, date.today())
+        self.assertEqual(product.last_modify_date, date.today())
+        # evaluated on every insert, not once when the module is imported
+        for name in ("create_date", "last_modify_date", "updated_at"):
+            self.assertTrue(Product.__table__.c[name].default.is_callable)
+
+    def test_increment_like(self):
+        """It should atomically add likes to a Product"""
+        product = ProductFactory(like=5)
+        product.create()
+        liked = Product.increment_like(product.id)
+        self.assertEqual(liked.like, 6)
+        liked = Product.increment_like(product.id, 4)
+        self.assertEqual(liked.like, 10)
+        self.assertEqual(Product.find(product.id).like, 10)
+        self.assertIsNone(Product.increment_like(0))
+
+    def test_add_likes(self):
+        """It should add aggregated likes to many Products"""
+        products = ProductFactory.create_batch(3, like=0)
+        for product in products:
+            product.create()
+        Product.add_likes({products[0].id: 3, products[2].id: 7})
+        db.session.expire_all()
+        self.assertEqual([Product.find(p.id).like for p in products], [3, 0, 7])
+
+    def test_change_log(self):
+        """It should append a change for every write to a Product"""
+        start = ProductChange.last_seq()
+        product = ProductFactory()
+        product.create()
+        product.name = "renamed"
+        product.update()
+        Product.increment_like(product.id)
+        Product.add_likes({product.id: 2})
+        ids = Product.bulk_create(ProductFactory.build_batch(2))
+        Product.bulk_update([Product.id.in_(ids)], {Product.available: True})
+        Product.bulk_delete([Product.id.in_(ids)])
+        Product.find(product.id).delete()
+        changes = ProductChange.find_since(start, 100, 2.0)
+        self.assertEqual(
+            [(change.product_id, change.op, change.version) for change in changes],
+            [
+                (product.id, "create", 1),
+                (product.id, "update", 2),
+                (product.id, "like", 3),
+                (product.id, "like", 4),
+                (ids[0], "create", 1),
+                (ids[1], "create", 1),
+                (ids[0], "update", 2),
+                (ids[1], "update", 2),
+                (ids[0], "delete", 2),
+                (ids[1], "delete", 2),
+                (product.id, "delete", 4),
+            ],
+        )
+        self.assertEqual(changes[0].serialize()["id"], product.id)
+        self.assertEqual(ProductChange.find_since(start, 2, 2.0), changes[:2])
+
+    def test_change_log_gaps(self):
+        """It should wait for the gaps in the change log to settle"""
+        start = ProductChange.last_seq()
+        now = datetime.utcnow()
+        db.session.add_all(
+            [
+                ProductChange(seq=start + 1, product_id=1, op="like", version=2, changed_at=now),
+                ProductChange(seq=start + 3, product_id=1, op="like", version=4, changed_at=now),
+            ]
+        )
+        db.session.commit()
+        # a write numbered start + 2 may still commit
+        changes = ProductChange.find_since(start, 100, 2.0)
+        self.assertEqual([change.seq for change in changes], [start + 1])
+        # until it is too old to be anything but a rollback
+        changes = ProductChange.find_since(start, 100, 0.0)
+        self.assertEqual([change.seq for change in changes], [start + 1, start + 3])
+
+        self.assertGreaterEqual(ProductChange.prune(now + timedelta(seconds=1)), 2)
+        ProductChange.append(db.session, [(1, "like", 5)])
+        db.session.commit()
+        self.assertRaises(ChangesPruned, ProductChange.find_since, start, 100, 2.0)
+        self.assertEqual(len(ProductChange.find_since(start + 3, 100, 2.0)), 1)
+
+    def test_version(self):
+        """It should bump the version of a Product on every write"""
+        product = ProductFactory()
+        product.create()
+        self.assertEqual(product.version, 1)
+        self.assertEqual(product.etag, f"{product.id}-1")
+        product.name = "renamed"
+        product.update()
+        self.assertEqual(product.version, 2)
+        self.assertEqual(Product.increment_like(product.id).version, 3)
+        Product.bulk_update([Product.id == product.id], {Product.like: 0})
+        db.session.expire_all()
+        self.assertEqual(Product.find(product.id).version, 4)
+
+    def test_update_stale_product(self):
+        """It should not Update a Product changed by someone else"""
+        if not db.engine.dialect.supports_sane_rowcount_returning:
+            self.skipTest("the database cannot verify the version on update")
+        product = ProductFactory()
+        product.create()
+        self.assertEqual(product.version, 1)
+        # simulate a concurrent write that the session does not know about
+        table = Product.__table__
+        db.session.execute(
+            update(table)
+            .where(table.c.id == product.id)
+            .values(version=table.c.version + 1)
+        )
+        product.name = "stale"
+        self.assertRaises(StaleDataError, product.update)
+
+    def test_delete_stale_product(self):
+        """It should Delete a Product changed by someone else"""
+        product = ProductFactory()
+        product.create()
+        start = ProductChange.last_seq()
+        # simulate a concurrent write that the session does not know about
+        table = Product.__table__
+        db.session.execute(
+            update(table)
+            .where(table.c.id == product.id)
+            .values(version=table.c.version + 1)
+        )
+        product.delete()
+        self.assertIsNone(Product.find(product.id))
+        changes = ProductChange.find_since(start, 100, 0.0)
+        self.assertEqual(
+            [(change.product_id, change.op, change.version) for change in changes],
+            [(product.id, "delete", 2)],
+        )
+
     def test_find_or_404_not_found(self):
         """It should return 404 not found"""
         self.assertRaises(NotFound, Product.find_or_404, 0)
@@ -0,0 +1,56 @@
+"""
+Test cases for the read replica routing
+"""
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock
+from flask import g
+from sqlalchemy import select, update
+from service import app
+from service.common.replica import ReplicaSession, is_sticky, sticky_cookie, writes
+from service.models import Product
+
+
+######################################################################
+#  R E P L I C A   T E S T   C A S E S
+######################################################################
+class TestReplica(TestCase):
+    """Test Cases for the read replica routing"""
+
+    def test_is_sticky(self):
+        """It should keep a client on the primary until the cookie expires"""
+        self.assertTrue(is_sticky(str(time.time() + 5)))
+        self.assertFalse(is_sticky(str(time.time() - 5)))
+        self.assertFalse(is_sticky("soon"))
+        self.assertFalse(is_sticky(None))
+
+    def test_sticky_cookie(self):
+        """It should make a short lived cookie"""
+        cookie = sticky_cookie(2.5)
+        self.assertTrue(cookie.startswith("read_primary="))
+        self.assertIn("Max-Age=3", cookie)
+        self.assertIn("HttpOnly", cookie)
+
+    def test_writes(self):
+        """It should tell reads from writes and locks"""
+        self.assertFalse(writes(None))
+        self.assertFalse(writes(select(Product)))
+        self.assertTrue(writes(select(Product).with_for_update()))
+        self.assertTrue(writes(update(Product).values(like=1)))
+
+    def test_get_bind(self):
+        """It should read from the replica only in read only requests"""
+        primary, replica = MagicMock(), MagicMock()
+        database = MagicMock(engines={None: primary, "replica": replica})
+        session = ReplicaSession(database)
+        with app.test_request_context():
+            g.read_replica = False
+            self.assertIs(session.get_bind(Product), primary)
+            g.read_replica = True
+            self.assertIs(session.get_bind(Product), replica)
+            self.assertIs(session.get_bind(Product, update(Product)), primary)
+            database.engines = {None: primary}
+            self.assertIs(session.get_bind(Product), primary)
+        # outside of requests, such as in the CLI or the like buffer
+        database.engines = {None: primary, "replica": replica}
+        self.assertIs(session.get_bind(Product), primary)
@@ -6,12 +6,22 @@ Test cases can be run with the following:
   coverage report -m
 """
 import os
+import json
+import time
+import tracemalloc
 import logging
-from unittest import TestCase
+from datetime import date, datetime, timedelta
+from unittest import TestCase, skipIf
+from unittest.mock import patch
+from flask import g
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
 
 
 from service import app
-from service.models import db, init_db, Product
+from service.routes import like_buffer, leaderboard, facets_cache, encode_cursor
+from service.models import db, init_db, Product, ProductChange, Category
 from service.common import status  # HTTP Status Codes
 from tests.factories import ProductFactory
 
@@ -58,6 +68,10 @@ class TestProductServer(TestCase):
         self.client = app.test_client()
         db.session.query(Product).delete()  # clean up the last tests
         db.session.commit()
+        Product.cache.clear()
+        leaderboard.clear()
+        facets_cache.clear()
+        Product.name_index.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -95,6 +109,109 @@ class TestProductServer(TestCase):
         data = response.get_json()
         self.assertEqual(data["status"], "OK")
 
+    def test_metrics(self):
+        """It should export request and database metrics"""
+        test_product = self._create_products(1)[0]
+        self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.client.get(f"{BASE_URL}/0")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        text = response.get_data(as_text=True)
+        self.assertIn(
+            'http_requests_total{endpoint="get_products",method="GET",status="200"}',
+            text,
+        )
+        self.assertIn(
+            'http_requests_total{endpoint="get_products",method="GET",status="404"}',
+            text,
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count{endpoint="create_products",method="POST"}',
+            text,
+        )
+        self.assertIn('db_queries_per_request_count{endpoint="create_products"}', text)
+        self.assertIn("db_pool_checked_out", text)
+        self.assertIn("# TYPE product_cache_hits_total counter", text)
+        self.assertIn("# TYPE product_cache_misses_total counter", text)
+
+    def test_request_id(self):
+        """It should return the id of every request"""
+        response = self.client.get("/health")
+        self.assertEqual(len(response.headers["X-Request-ID"]), 32)
+        response = self.client.get("/health", headers={"X-Request-ID": "abc-123"})
+        self.assertEqual(response.headers["X-Request-ID"], "abc-123")
+        response = self.client.get("/health", headers={"X-Request-ID": "a b;c"})
+        self.assertNotEqual(response.headers["X-Request-ID"], "a b;c")
+
+    def test_profile_request(self):
+        """It should profile a request sent with X-Profile"""
+        self._create_products(2)
+        response = self.client.get(BASE_URL, headers={"X-Profile": "1"})
+        self.assertNotIn("X-Profile-URL", response.headers)
+
+        app.config["PROFILING_ENABLED"] = True
+        try:
+            response = self.client.get(BASE_URL, headers={"X-Profile": "1"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            profile_url = response.headers["X-Profile-URL"]
+            request_id = response.headers["X-Request-ID"]
+            self.assertEqual(profile_url, f"/profiles/{request_id}")
+            response = self.client.get(profile_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            profile = response.get_json()
+            self.assertEqual(profile["path"], "/products?")
+            self.assertEqual(len(profile["sql"]), 1)
+            self.assertIn("SELECT", profile["sql"][0]["statement"])
+            self.assertIn("list_products", profile["stats"])
+            # nothing of the profile stays in the g of the app context
+            self.client.get(f"{BASE_URL}/0", headers={"X-Profile": "1"})
+            for name in ("profiler", "sql_statements", "profile_start"):
+                self.assertNotIn(name, g)
+            response = self.client.get("/profiles/unknown")
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        finally:
+            app.config["PROFILING_ENABLED"] = False
+        response = self.client.get(profile_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @skipIf(DATABASE_URI == "sqlite://", "another engine of sqlite:// opens another empty database")
+    def test_read_replica(self):
+        """It should read from the replica unless the client just wrote"""
+        replica = create_engine(DATABASE_URI)
+        statements = []
+        event.listen(replica, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        try:
+            with patch.dict(app.config, {"REPLICA_DATABASE_URI": DATABASE_URI}), \
+                    patch.dict(db.engines, {"replica": replica}):
+                product = self._create_products(1)[0]
+                self.assertEqual(statements, [])
+                self.assertIn("read_primary", {cookie.name for cookie in self.client.cookie_jar})
+
+                reader = app.test_client()
+                response = reader.get(f"{BASE_URL}/{product.id}")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(len(statements), 1)
+                self.assertIsNone(Product.cache.get(product.id))
+                response = reader.get(BASE_URL)
+                self.assertEqual(len(response.get_json()), 1)
+                self.assertEqual(len(statements), 2)
+
+                # the writer reads its own writes from the primary
+                response = self.client.get(f"{BASE_URL}/{product.id}")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(len(statements), 2)
+                self.assertIn("replica", self.client.get("/stats/pool").get_json())
+        finally:
+            db.session.remove()
+            replica.dispose()
+
+    def test_pool_stats(self):
+        """It should report the connection pool usage"""
+        response = self.client.get("/stats/pool")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("pool", response.get_json())
+
     def test_get_product(self):
         """It should Get a single Product"""
         # get the id of a product
@@ -104,6 +221,90 @@ class TestProductServer(TestCase):
         data = response.get_json()
         self.assertEqual(data["name"], test_product.name)
 
+    def test_get_product_cached(self):
+        """It should Get a Product from the cache until it changes"""
+        test_product = self._create_products(1)[0]
+        misses = Product.cache.stats()["misses"]
+        hits = Product.cache.stats()["hits"]
+        for _ in range(3):
+            response = self.client.get(f"{BASE_URL}/{test_product.id}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get("/stats/cache")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["misses"], misses + 1)
+        self.assertEqual(data["hits"], hits + 2)
+
+        # writes must invalidate the cached copy
+        new_product = self.client.get(f"{BASE_URL}/{test_product.id}").get_json()
+        new_product["name"] = "renamed"
+        self.client.put(f"{BASE_URL}/{test_product.id}", json=new_product)
+        data = self.client.get(f"{BASE_URL}/{test_product.id}").get_json()
+        self.assertEqual(data["name"], "renamed")
+        self.client.put(f"{BASE_URL}/like/{test_product.id}", json={})
+        data = self.client.get(f"{BASE_URL}/{test_product.id}").get_json()
+        self.assertEqual(data["like"], new_product["like"] + 1)
+        self.client.delete(f"{BASE_URL}/{test_product.id}")
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_product_not_modified(self):
+        """It should return 304 for a Product that has not changed"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        etag = response.headers["ETag"]
+        self.assertIsNotNone(response.headers.get("Last-Modified"))
+        response = self.client.get(
+            f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.headers["ETag"], etag)
+
+        # a like is a new version with a new entity tag
+        self.client.put(f"{BASE_URL}/like/{test_product.id}", json={})
+        response = self.client.get(
+            f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_get_product_list_not_modified(self):
+        """It should return 304 for a list of Products that has not changed"""
+        products = self._create_products(3)
+        response = self.client.get(BASE_URL)
+        etag = response.headers["ETag"]
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(
+            BASE_URL, query_string="limit=2", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.delete(f"{BASE_URL}/{products[0].id}")
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_update_product_if_match(self):
+        """It should only Update a Product whose ETag matches If-Match"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        etag = response.headers["ETag"]
+        data = response.get_json()
+        data["name"] = "first"
+        response = self.client.put(
+            f"{BASE_URL}/{test_product.id}", json=data, headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+        # the old entity tag is stale now
+        data["name"] = "second"
+        response = self.client.put(
+            f"{BASE_URL}/{test_product.id}", json=data, headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        data = self.client.get(f"{BASE_URL}/{test_product.id}").get_json()
+        self.assertEqual(data["name"], "first")
+
     def test_get_product_not_found(self):
         """It should not Get a Product thats not found"""
         response = self.client.get(f"{BASE_URL}/0")
@@ -120,6 +321,251 @@ class TestProductServer(TestCase):
         data = response.get_json()
         self.assertEqual(len(data), 5)
 
+    def test_query_product_list(self):
+        """It should Query Products by several fields at once"""
+        products = self._create_products(10)
+        color = products[0].color
+        size = products[0].size
+        expected = [p.id for p in products if p.color == color and p.size == size]
+        response = self.client.get(
+            BASE_URL, query_string={"color": color.name, "size": size.name}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(sorted(item["id"] for item in data), sorted(expected))
+
+    def test_query_product_list_bad_filter(self):
+        """It should not Query Products with a bad filter value"""
+        response = self.client.get(BASE_URL, query_string="size=XXXL")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_product_list_paginated(self):
+        """It should Get a list of Products one page at a time"""
+        products = self._create_products(5)
+        response = self.client.get(BASE_URL, query_string="limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([item["id"] for item in data], [p.id for p in products[:2]])
+        self.assertIn('rel="next"', response.headers["Link"])
+
+        # follow the cursors until the last page
+        seen = [item["id"] for item in data]
+        while "X-Next-Cursor" in response.headers:
+            cursor = response.headers["X-Next-Cursor"]
+            response = self.client.get(
+                BASE_URL, query_string={"limit": 2, "cursor": cursor}
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(item["id"] for item in response.get_json())
+        self.assertEqual(seen, [product.id for product in products])
+        self.assertNotIn("Link", response.headers)
+
+    def test_stream_product_list(self):
+        """It should Stream a list of Products as NDJSON"""
+        products = self._create_products(3)
+        response = self.client.get(BASE_URL, query_string="stream=1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        data = [json.loads(line) for line in lines]
+        self.assertEqual([item["id"] for item in data], [p.id for p in products])
+
+        response = self.client.get(
+            BASE_URL, headers={"Accept": "application/x-ndjson"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_data(as_text=True).splitlines()), 3)
+
+    def test_get_product_list_over_budget(self):
+        """It should Stream a list of Products that is over the response budget"""
+        products = self._create_products(3)
+        for budget in ({"MAX_RESPONSE_ROWS": 2}, {"MAX_RESPONSE_BYTES": 100}):
+            with patch.dict(app.config, budget):
+                response = self.client.get(BASE_URL, query_string="sort=-id")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.mimetype, "application/json")
+            self.assertNotIn("ETag", response.headers)
+            data = response.get_json()
+            self.assertEqual([item["id"] for item in data], [p.id for p in reversed(products)])
+
+        with patch.dict(app.config, {"MAX_RESPONSE_ROWS": 3}):
+            response = self.client.get(BASE_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("ETag", response.headers)
+
+    def test_get_product_list_over_budget_rejected(self):
+        """It should refuse a list of Products that is over the response budget"""
+        self._create_products(3)
+        with patch.dict(app.config, {"MAX_RESPONSE_ROWS": 2, "OVER_BUDGET": "reject"}):
+            response = self.client.get(BASE_URL, query_string="sort=id")
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        message = response.get_json()["message"]
+        self.assertIn("more than 2 products", message)
+        self.assertIn("/products?sort=id&limit=100", message)
+
+    def test_memory_sampling(self):
+        """It should record the peak memory of sampled requests"""
+        self._create_products(3)
+        with patch.dict(app.config, {"MEMORY_SAMPLE_RATE": 1.0}):
+            self.client.get(BASE_URL)
+            self.client.get(BASE_URL, query_string="stream=1")
+        self.assertFalse(tracemalloc.is_tracing())
+        text = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn('http_request_peak_memory_bytes_count{endpoint="list_products"}', text)
+        self.assertIn("process_max_resident_memory_bytes", text)
+
+    def test_get_product_list_fields(self):
+        """It should Get only the requested fields of Products"""
+        products = self._create_products(3)
+        response = self.client.get(BASE_URL, query_string="fields=id,name,available")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), 3)
+        for item in data:
+            self.assertEqual(set(item), {"id", "name", "available"})
+        etag = response.headers["ETag"]
+
+        response = self.client.get(BASE_URL, query_string="fields=name&limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), [{"name": p.name} for p in products[:2]])
+        self.assertIn("X-Next-Cursor", response.headers)
+
+        response = self.client.get(BASE_URL, query_string="fields=name&stream=1")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{"name": p.name} for p in products])
+
+        response = self.client.get(BASE_URL)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_get_product_fields(self):
+        """It should Get only the requested fields of a Product"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(
+            f"{BASE_URL}/{test_product.id}", query_string="fields=name, like"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"name": test_product.name, "like": test_product.like})
+        etag = response.headers["ETag"]
+        last_modified = response.last_modified
+        self.assertIsNotNone(last_modified)
+
+        # the cached product is projected the same way
+        full = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertNotEqual(full.headers["ETag"], etag)
+        self.assertEqual(full.last_modified, last_modified)
+        response = self.client.get(
+            f"{BASE_URL}/{test_product.id}", query_string="fields=name,last_modify_date"
+        )
+        self.assertEqual(response.last_modified, last_modified)
+        response = self.client.get(
+            f"{BASE_URL}/{test_product.id}", query_string="fields=name,like"
+        )
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.last_modified, last_modified)
+        self.assertEqual(set(response.get_json()), {"name", "like"})
+
+        response = self.client.get(f"{BASE_URL}/0", query_string="fields=name")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_product_bad_fields(self):
+        """It should not Get unknown fields of Products"""
+        response = self.client.get(BASE_URL, query_string="fields=name,price")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}/1", query_string="fields=")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_product_list_sorted(self):
+        """It should Get Products sorted by the sort parameter"""
+        for like in [3, 1, 3, 2, 1, 3]:
+            product = ProductFactory(like=like)
+            response = self.client.post(BASE_URL, json=product.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        products = self.client.get(BASE_URL).get_json()
+
+        def days(product):
+            return date.fromisoformat(product["create_date"]).toordinal()
+
+        for sort, key in [
+            ("-like", lambda p: (-p["like"], -p["id"])),
+            ("like,-create_date", lambda p: (p["like"], -days(p), -p["id"])),
+            ("available,name", lambda p: (p["available"], p["name"], p["id"])),
+        ]:
+            expected = [p["id"] for p in sorted(products, key=key)]
+            response = self.client.get(BASE_URL, query_string={"sort": sort})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([p["id"] for p in response.get_json()], expected)
+
+            # the same order a page at a time, with and without the sort fields
+            for fields in ["id", "id,like,create_date"]:
+                seen = []
+                args = {"sort": sort, "limit": 4, "fields": fields}
+                while True:
+                    response = self.client.get(BASE_URL, query_string=args)
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    seen.extend(p["id"] for p in response.get_json())
+                    if "X-Next-Cursor" not in response.headers:
+                        break
+                    args["cursor"] = response.headers["X-Next-Cursor"]
+                self.assertEqual(seen, expected)
+
+            response = self.client.get(BASE_URL, query_string={"sort": sort, "stream": 1})
+            lines = response.get_data(as_text=True).splitlines()
+            self.assertEqual([json.loads(line)["id"] for line in lines], expected)
+
+    def test_get_product_list_updated_since(self):
+        """It should Get the Products written since the last sync a page at a time"""
+        products = self._create_products(5)
+        response = self.client.get(f"{BASE_URL}/{products[2].id}")
+        since = response.get_json()["updated_at"]
+        self.assertIsNotNone(response.last_modified)
+
+        response = self.client.put(f"{BASE_URL}/like/{products[0].id}", json={})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = [products[2].id, products[3].id, products[4].id, products[0].id]
+
+        seen = []
+        args = {"updated_since": since, "sort": "updated_at", "limit": 2}
+        while True:
+            response = self.client.get(BASE_URL, query_string=args)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            page = response.get_json()
+            self.assertTrue(all(p["updated_at"] >= since for p in page))
+            seen.extend(p["id"] for p in page)
+            if "X-Next-Cursor" not in response.headers:
+                break
+            args["cursor"] = response.headers["X-Next-Cursor"]
+        self.assertEqual(seen, expected)
+
+        response = self.client.get(BASE_URL, query_string="updated_since=last-week")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_product_list_bad_sort(self):
+        """It should not Get Products with a bad sort or a cursor of another sort"""
+        response = self.client.get(BASE_URL, query_string="sort=price")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL, query_string="sort=like,-like")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self._create_products(3)
+        response = self.client.get(BASE_URL, query_string="sort=-like&limit=1")
+        cursor = response.headers["X-Next-Cursor"]
+        response = self.client.get(BASE_URL, query_string={"sort": "like", "limit": 1, "cursor": cursor})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL, query_string={"limit": 1, "cursor": cursor})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_product_list_bad_page(self):
+        """It should not Get a page of Products with a bad limit or cursor"""
+        response = self.client.get(BASE_URL, query_string="limit=zero")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL, query_string="limit=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL, query_string="cursor=not-a-cursor")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        cursor = encode_cursor({"sort": "like", "values": ["abc"], "id": 1})
+        response = self.client.get(BASE_URL, query_string={"sort": "like", "limit": 1, "cursor": cursor})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_create_product(self):
         """It should Create a new Product"""
         test_product = ProductFactory()
@@ -149,6 +595,137 @@ class TestProductServer(TestCase):
         self.assertEqual(new_product["category"], test_product.category.name)
         self.assertEqual(new_product["size"], test_product.size.name)
 
+    def test_create_product_batch(self):
+        """It should Create a batch of Products in chunks"""
+        products = [ProductFactory().serialize() for _ in range(5)]
+        products[3]["color"] = "PLAID"
+        response = self.client.post(
+            f"{BASE_URL}:batch", json=products, query_string="chunk_size=2"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertEqual(data["created"], 4)
+        self.assertEqual(data["failed"], 1)
+        self.assertEqual([r["index"] for r in data["results"]], [0, 1, 2, 3, 4])
+        self.assertIn("error", data["results"][3])
+        for result in data["results"][:3] + data["results"][4:]:
+            response = self.client.get(f"{BASE_URL}/{result['id']}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                response.get_json()["name"], products[result["index"]]["name"]
+            )
+
+    def test_create_product_batch_bad_rows(self):
+        """It should only fail the items of a batch chunk the database refuses"""
+        products = [ProductFactory().serialize() for _ in range(6)]
+        products[1]["name"] = "x" * 64
+        products[2]["like"] = "many"
+        products[3]["create_date"] = "notadate"
+        products[4]["name"] = "refused"
+        bulk_create = Product.bulk_create
+
+        def refuse(chunk):
+            if any(product.name == "refused" for product in chunk):
+                raise SQLAlchemyError("refused by the database")
+            return bulk_create(chunk)
+
+        with patch.object(Product, "bulk_create", side_effect=refuse) as bulk_mock:
+            response = self.client.post(f"{BASE_URL}:batch", json=products)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertEqual(data["created"], 2)
+        self.assertEqual([r["index"] for r in data["results"] if "error" in r], [1, 2, 3, 4])
+        self.assertIn("name", data["results"][1]["error"])
+        self.assertIn("notadate", data["results"][3]["error"])
+        # the chunk of 3 is split until the refused item is alone
+        self.assertEqual(bulk_mock.call_count, 5)
+
+    def test_create_product_batch_ndjson(self):
+        """It should Create a batch of Products from NDJSON"""
+        lines = [json.dumps(ProductFactory().serialize()) for _ in range(3)]
+        lines.insert(1, "{not json")
+        response = self.client.post(
+            f"{BASE_URL}:batch",
+            data="\n".join(lines),
+            content_type="application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertEqual(data["created"], 3)
+        self.assertIn("error", data["results"][1])
+        self.assertEqual(len(Product.all()), 3)
+
+    def test_create_product_batch_bad_request(self):
+        """It should not Create a batch of Products from a bad body"""
+        response = self.client.post(f"{BASE_URL}:batch", json={"name": "pot"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"{BASE_URL}:batch", json=[{}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            f"{BASE_URL}:batch", json=[], query_string="chunk_size=-1"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            f"{BASE_URL}:batch", data="[]", content_type="text/csv"
+        )
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_update_product_batch(self):
+        """It should Update a batch of Products with one statement"""
+        products = self._create_products(6)
+        category = products[0].category
+        expected = [p.id for p in products if p.category == category]
+        response = self.client.patch(
+            f"{BASE_URL}:batch",
+            json={"filter": {"category": category.name}, "set": {"available": False}},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["count"], len(expected))
+        for product_id in expected:
+            data = self.client.get(f"{BASE_URL}/{product_id}").get_json()
+            self.assertFalse(data["available"])
+
+        ids = [products[1].id, products[2].id]
+        response = self.client.put(
+            f"{BASE_URL}:batch", json={"ids": ids, "set": {"like": 42, "size": "XS"}}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["count"], 2)
+        for product_id in ids:
+            data = self.client.get(f"{BASE_URL}/{product_id}").get_json()
+            self.assertEqual(data["like"], 42)
+            self.assertEqual(data["size"], "XS")
+
+    def test_update_product_batch_bad_request(self):
+        """It should not Update a batch of Products from a bad body"""
+        for body in (
+            [],
+            {"set": {"like": 1}},
+            {"ids": [1], "set": {"price": 1}},
+            {"ids": [1], "set": {"like": "many"}},
+            {"ids": [1], "set": {"name": None}},
+            {"ids": [1], "set": {"name": {"first": "hat"}}},
+            {"ids": [1], "set": {"name": "x" * 64}},
+            {"ids": ["1"], "set": {"like": 1}},
+            {"filter": {"colour": "RED"}, "set": {"like": 1}},
+            {"filter": {"color": "PLAID"}, "set": {"like": 1}},
+        ):
+            response = self.client.patch(f"{BASE_URL}:batch", json=body)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+
+    def test_delete_product_batch(self):
+        """It should Delete a batch of Products with one statement"""
+        products = self._create_products(5)
+        response = self.client.delete(
+            f"{BASE_URL}:batch",
+            json={"ids": [p.id for p in products[:3]], "filter": {"like_min": 0}},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["count"], 3)
+        self.assertEqual(len(Product.all()), 2)
+        response = self.client.delete(f"{BASE_URL}:batch", json={})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_update_product(self):
         """It should Update an existing Product"""
         # create a product to update
@@ -183,6 +760,251 @@ class TestProductServer(TestCase):
         updated_product = response.get_json()
         self.assertEqual(updated_product["like"], old_like + 1)
 
+    def test_search_products(self):
+        """It should Search Products by name prefix"""
+        names = ["Cheddar Cheese", "Cheese", "Blue cheese knife", "Pot"]
+        ids = []
+        for name in names:
+            response = self.client.post(BASE_URL, json=ProductFactory(name=name).serialize())
+            ids.append(response.get_json()["id"])
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=chee")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([p["id"] for p in data], [ids[1], ids[0], ids[2]])
+        self.assertEqual(data[0]["name"], "Cheese")
+
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=cheese&limit=1")
+        self.assertEqual([p["id"] for p in response.get_json()], [ids[1]])
+
+        # writes update the index
+        product = response.get_json()[0]
+        product["name"] = "Gouda"
+        self.client.put(f"{BASE_URL}/{product['id']}", json=product)
+        self.client.delete(f"{BASE_URL}/{ids[2]}")
+        response = self.client.post(BASE_URL, json=ProductFactory(name="Cheesecake").serialize())
+        new_id = response.get_json()["id"]
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=chee")
+        self.assertEqual([p["id"] for p in response.get_json()], [new_id, ids[0]])
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=gou")
+        self.assertEqual([p["id"] for p in response.get_json()], [ids[1]])
+
+    def test_search_products_bad_request(self):
+        """It should not Search Products without q or with a bad limit"""
+        for query in ["", "q=%20", "q=pot&limit=1000"]:
+            response = self.client.get(f"{BASE_URL}/search", query_string=query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=%25%25")
+        self.assertEqual(response.get_json(), [])
+
+    def test_get_facets(self):
+        """It should count Products by category, color, size and availability"""
+        products = self._create_products(6)
+        response = self.client.get(f"{BASE_URL}/facets")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(set(data), {"category", "color", "size", "available"})
+        for facet in ["category", "color", "size"]:
+            expected = {}
+            for product in products:
+                name = getattr(product, facet).name
+                expected[name] = expected.get(name, 0) + 1
+            self.assertEqual(data[facet], expected)
+        available = sum(1 for product in products if product.available)
+        self.assertEqual(data["available"].get("true", 0), available)
+        self.assertEqual(data["available"].get("false", 0), 6 - available)
+
+        color = products[0].color.name
+        response = self.client.get(f"{BASE_URL}/facets", query_string={"color": color})
+        data = response.get_json()
+        self.assertEqual(data["color"], {color: sum(1 for p in products if p.color.name == color)})
+
+        # the counts are cached until they expire
+        with patch.object(Product, "facets") as facets:
+            response = self.client.get(f"{BASE_URL}/facets", query_string={"color": color, "page": 2})
+            facets.assert_not_called()
+        self.assertEqual(response.get_json(), data)
+
+        response = self.client.get(f"{BASE_URL}/facets", query_string="like_min=ten")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_changes(self):
+        """It should return the changes to Products after a sequence number"""
+        response = self.client.get(f"{BASE_URL}/changes")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        start = response.get_json()["next"]
+        product = self._create_products(1)[0]
+        self.client.put(f"{BASE_URL}/like/{product.id}", json={})
+        other = self._create_products(1)[0]
+        self.client.delete(f"{BASE_URL}/{other.id}")
+
+        response = self.client.get(f"{BASE_URL}/changes", query_string={"since": start})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        changes = data["changes"]
+        self.assertEqual(
+            [(change["id"], change["op"]) for change in changes],
+            [(product.id, "create"), (product.id, "like"), (other.id, "create"), (other.id, "delete")],
+        )
+        self.assertEqual(changes[1]["product"]["like"], product.like + 1)
+        self.assertIsNone(changes[2]["product"])
+        self.assertEqual(data["next"], changes[-1]["seq"])
+
+        response = self.client.get(f"{BASE_URL}/changes", query_string={"since": start, "limit": 1})
+        self.assertEqual(response.get_json()["next"], changes[0]["seq"])
+
+    def test_get_changes_long_poll(self):
+        """It should wait for changes to Products"""
+        start = self.client.get(f"{BASE_URL}/changes").get_json()["next"]
+        with patch.dict(app.config, {"CHANGES_POLL_INTERVAL": 0.01, "MAX_CHANGES_WAIT": 20}), \
+                patch.object(time, "sleep") as sleep:
+            sleep.side_effect = lambda seconds: self._create_products(1)
+            response = self.client.get(
+                f"{BASE_URL}/changes", query_string={"since": start, "wait": 5}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()["changes"]), 1)
+        sleep.assert_called_once()
+
+        started = time.monotonic()
+        with patch.dict(app.config, {"MAX_CHANGES_WAIT": 20}):
+            response = self.client.get(
+                f"{BASE_URL}/changes", query_string={"since": start + 1, "wait": 0.05}
+            )
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual(response.get_json(), {"changes": [], "next": start + 1})
+
+    def test_get_changes_bad_request(self):
+        """It should not return changes for invalid parameters"""
+        # long polls are off by default, they would hold a sync worker
+        for query in ("since=abc", "since=-1", "since=0&wait=1", "since=0&wait=soon"):
+            response = self.client.get(f"{BASE_URL}/changes", query_string=query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+        self._create_products(1)
+        ProductChange.prune(datetime.utcnow() + timedelta(seconds=1))
+        self._create_products(1)
+        response = self.client.get(f"{BASE_URL}/changes", query_string="since=0")
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_get_leaderboard(self):
+        """It should Get the most liked Products of every Category"""
+        products = []
+        for like in [5, 3, 1]:
+            product = ProductFactory(category=Category.GROCERIES, like=like)
+            response = self.client.post(BASE_URL, json=product.serialize())
+            products.append(response.get_json())
+        response = self.client.get(f"{BASE_URL}/leaderboard", query_string="limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(set(data), {category.name for category in Category})
+        self.assertEqual(data["GROCERIES"], products[:2])
+        self.assertEqual(data["BEAUTY"], [])
+
+        # likes move products up without reading the database again
+        for _ in range(3):
+            self.client.put(f"{BASE_URL}/like/{products[2]['id']}", json={})
+        with patch.object(leaderboard, "load_top") as load_top:
+            response = self.client.get(
+                f"{BASE_URL}/leaderboard", query_string="category=GROCERIES&limit=2"
+            )
+            load_top.assert_not_called()
+        self.assertEqual(list(response.get_json()), ["GROCERIES"])
+        self.assertEqual(
+            [p["id"] for p in response.get_json()["GROCERIES"]],
+            [products[0]["id"], products[2]["id"]],
+        )
+
+        # deleting a product reloads its board
+        self.client.delete(f"{BASE_URL}/{products[0]['id']}")
+        response = self.client.get(f"{BASE_URL}/leaderboard", query_string="category=GROCERIES")
+        self.assertEqual(
+            [p["id"] for p in response.get_json()["GROCERIES"]],
+            [products[2]["id"], products[1]["id"]],
+        )
+
+    def test_get_leaderboard_bad_request(self):
+        """It should not Get the leaderboard with a bad category or limit"""
+        for query in ["category=FOOD", "limit=0", "limit=1000", "limit=ten"]:
+            response = self.client.get(f"{BASE_URL}/leaderboard", query_string=query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_like_product_write_behind(self):
+        """It should buffer Likes and write them on flush"""
+        test_product = self._create_products(1)[0]
+        app.config["LIKE_WRITE_BEHIND"] = True
+        try:
+            for count in range(1, 4):
+                response = self.client.put(
+                    f"{BASE_URL}/like/{test_product.id}", json={}
+                )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.get_json()["like"], test_product.like + count)
+            response = self.client.put(f"{BASE_URL}/like/0", json={})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        finally:
+            app.config["LIKE_WRITE_BEHIND"] = False
+            like_buffer.stop()
+        data = self.client.get(f"{BASE_URL}/{test_product.id}").get_json()
+        self.assertEqual(data["like"], test_product.like + 3)
+
+    def test_update_product_race(self):
+        """It should retry a racing Update unless it has an If-Match"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        etag = response.headers["ETag"]
+        data = response.get_json()
+        save = Product.update
+
+        def racing_update(product):
+            # another write landed between the read and the write
+            db.session.rollback()
+            raise StaleDataError("the version has changed")
+
+        data["name"] = "first"
+        with patch.object(Product, "update", racing_update):
+            response = self.client.put(
+                f"{BASE_URL}/{test_product.id}", json=data, headers={"If-Match": etag}
+            )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        with patch.object(Product, "update", racing_update):
+            response = self.client.put(f"{BASE_URL}/{test_product.id}", json=data)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        races = []
+
+        def racing_once(product):
+            if not races:
+                races.append(product.id)
+                racing_update(product)
+            else:
+                save(product)
+
+        with patch.object(Product, "update", racing_once):
+            response = self.client.put(f"{BASE_URL}/{test_product.id}", json=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["name"], "first")
+
+    def test_delete_product_race(self):
+        """It should Delete a Product changed since it was read"""
+        test_product = self._create_products(1)[0]
+        find = Product.find
+        table = Product.__table__
+
+        def racing_find(product_id):
+            product = find(product_id)
+            # a like lands between the read and the delete
+            db.session.execute(
+                table.update()
+                .where(table.c.id == product_id)
+                .values(like=table.c.like + 1, version=table.c.version + 1)
+            )
+            return product
+
+        with patch.object(Product, "find", side_effect=racing_find):
+            response = self.client.delete(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_delete_product(self):
         """It should Delete a Product"""
         test_product = self._create_products(1)[0]
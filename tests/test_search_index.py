@@ -0,0 +1,60 @@
+"""
+Test cases for the Search Index
+"""
+from unittest import TestCase
+from service.common.search_index import PrefixIndex, words
+
+
+######################################################################
+#  S E A R C H   I N D E X   T E S T   C A S E S
+######################################################################
+class TestPrefixIndex(TestCase):
+    """Test Cases for PrefixIndex"""
+
+    def setUp(self):
+        """This runs before each test"""
+        self.index = PrefixIndex()
+        self.index.load(
+            [
+                (1, "Cheddar Cheese"),
+                (2, "Cheese"),
+                (3, "Blue cheese knife"),
+                (4, "Chess board"),
+                (5, "Pot"),
+            ]
+        )
+
+    def test_words(self):
+        """It should split a text into lower case words"""
+        self.assertEqual(words("Blue-cheese  Knife!"), ["blue", "cheese", "knife"])
+        self.assertEqual(words(" %% "), [])
+
+    def test_search(self):
+        """It should rank the names matching every prefix"""
+        self.assertEqual(self.index.search("che", 10), [2, 4, 1, 3])
+        self.assertEqual(self.index.search("cheese", 10), [2, 1, 3])
+        self.assertEqual(self.index.search("cheese", 2), [2, 1])
+        self.assertEqual(self.index.search("kni CHE", 10), [3])
+        self.assertEqual(self.index.search("milk", 10), [])
+        self.assertEqual(self.index.search("", 10), [])
+
+    def test_add_and_discard(self):
+        """It should keep the index up to date"""
+        self.index.add(5, "Cheese pot")
+        self.assertEqual(self.index.search("pot", 10), [5])
+        self.assertIn(5, self.index.search("cheese", 10))
+        self.index.add(6, "Potato")
+        self.assertEqual(self.index.search("pot", 10), [6, 5])
+        self.index.discard(5)
+        self.index.discard(42)
+        self.assertEqual(self.index.search("pot", 10), [6])
+
+    def test_clear(self):
+        """It should ignore changes until it is loaded again"""
+        self.index.clear()
+        self.assertFalse(self.index.loaded)
+        self.index.add(7, "Cheese")
+        self.index.discard(2)
+        self.assertEqual(self.index.search("cheese", 10), [])
+        self.index.load([(7, "Cheese")])
+        self.assertEqual(self.index.search("cheese", 10), [7])
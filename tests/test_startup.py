@@ -0,0 +1,36 @@
+"""
+Test cases for the service start up
+"""
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+# a database that cannot be opened, any connection attempt fails
+UNREACHABLE_URI = "sqlite:////nonexistent/directory/products.db"
+
+
+######################################################################
+#  S T A R T U P   T E S T   C A S E S
+######################################################################
+class TestStartup(TestCase):
+    """Test Cases for the service start up"""
+
+    def boot(self, auto_create: str) -> int:
+        """Imports the service in a new interpreter and returns its exit code"""
+        env = dict(os.environ, DATABASE_URI=UNREACHABLE_URI, DB_AUTO_CREATE=auto_create)
+        return subprocess.run(
+            [sys.executable, "-c", "import service"],
+            env=env,
+            capture_output=True,
+            check=False,
+            timeout=60,
+        ).returncode
+
+    def test_boot_without_database(self):
+        """It should start without connecting when DB_AUTO_CREATE is off"""
+        self.assertEqual(self.boot("false"), 0)
+
+    def test_boot_creates_tables(self):
+        """It should connect to create the tables when DB_AUTO_CREATE is on"""
+        self.assertEqual(self.boot("true"), 4)